@@ -0,0 +1,266 @@
+"""
+Benchmarks of the hot paths of the board, the env, the MCTS and the model.
+
+Usage (from the repository root):
+    python benchmarks/bench_hotpaths.py                     # run and compare with benchmarks/baseline.json
+    python benchmarks/bench_hotpaths.py --update-baseline   # run and store the results as the new baseline
+    python benchmarks/bench_hotpaths.py --filter mcts       # only run the benchmarks whose name contains "mcts"
+
+All the benchmarks use fixed seeds and a random (numpy) evaluator instead of the NN, except the (numpy_)model_forward ones.
+The exit code is 1 if any benchmark is slower than the baseline by more than --threshold.
+"""
+from typing import Callable, Dict, Tuple
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gomoku.game.board import GomoBoard
+from gomoku.reinforcement_learning.base.player import Game, IntuitivePlayer
+from gomoku.reinforcement_learning.base.monte_carlo import MCTSNode, select_node, expand, alphazero_play_one_game
+from gomoku.reinforcement_learning.gomoku.gomoku_env import GomoEnv
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+BOARD_SIZE = 15
+SEED = 0
+
+
+def random_player(seed: int = SEED) -> IntuitivePlayer:
+    """
+    A player whose policy and value are random numbers, so that the search can be benchmarked without the NN.
+    """
+    rng = np.random.default_rng(seed)
+
+    def policy_generator(state: np.ndarray) -> np.ndarray:
+        policy = rng.random(state.size) * (state.flatten() == 0)
+        return policy / policy.sum()
+
+    def value_estimator(states: np.ndarray) -> np.ndarray:
+        return rng.uniform(-1, 1, len(states)).astype(np.float32)
+
+    return IntuitivePlayer(policy_generator, value_estimator)
+
+
+def midgame_board(n_moves: int = 40, board_size: int = BOARD_SIZE, seed: int = SEED) -> GomoBoard:
+    """
+    A board with `n_moves` random moves and no winner.
+    """
+    rng = np.random.default_rng(seed)
+    board = GomoBoard(board_size)
+    while len(board.history) - 1 < n_moves:
+        x, y = rng.integers(0, board_size, 2)
+        if board.play(x, y) and board.winner is not None:
+            board.undo()
+            board.winner = None
+    return board
+
+
+def midgame_game(n_moves: int = 40, board_size: int = BOARD_SIZE) -> Game:
+    player = random_player()
+    board = midgame_board(n_moves, board_size)
+    board.trim_history()
+    return Game(player, player, GomoEnv(board))
+
+
+# Each benchmark is a setup function returning (function to time, number of calls per timing)
+def bench_board_play() -> Tuple[Callable, int]:
+    board = midgame_board()
+    x, y = map(int, np.argwhere(board.get_board() == 0)[0])
+
+    def run():
+        board.play(x, y)
+        board.undo()
+    return run, 1000
+
+
+def bench_board_check_game_ended() -> Tuple[Callable, int]:
+    board = midgame_board()
+    return board.check_game_ended, 1000
+
+
+def bench_board_clone() -> Tuple[Callable, int]:
+    board = midgame_board()
+    return board.clone, 200
+
+
+def bench_env_all_valid_actions() -> Tuple[Callable, int]:
+    env = GomoEnv(midgame_board())
+    return env.all_valid_actions, 1000
+
+
+def bench_mcts_expand() -> Tuple[Callable, int]:
+    game = midgame_game()
+    player = game.get_next_player()
+
+    def run():
+        expand(MCTSNode(game), player)
+    return run, 10
+
+
+def bench_mcts_select_node() -> Tuple[Callable, int]:
+    game = midgame_game()
+    root = MCTSNode(game)
+    for _ in range(200):
+        node = select_node(root, 5)
+        expand(node, game.get_next_player())
+        node.simulation()
+    return lambda: select_node(root, 5), 200
+
+
+def make_bench_search(n_simulations: int) -> Callable[[], Tuple[Callable, int]]:
+    def bench_search() -> Tuple[Callable, int]:
+        game = midgame_game()
+
+        def run():
+            player = random_player()  # A new RNG per call, so that every repeat searches the same tree
+            root = MCTSNode(Game(player, player, game.env.clone()))
+            for _ in range(n_simulations):
+                node = select_node(root, 5)
+                expand(node, player)
+                node.simulation()
+        return run, 1
+    return bench_search
+
+
+def bench_selfplay_game() -> Tuple[Callable, int]:
+    def run():
+        player = random_player()  # A new RNG per call, so that every repeat plays the same game
+        with contextlib.redirect_stdout(io.StringIO()):
+            alphazero_play_one_game(Game(player, player, GomoEnv(GomoBoard(9))), 10, 5, verbose=False)
+    return run, 1
+
+
+def make_bench_model_forward(batch_size: int) -> Callable[[], Tuple[Callable, int]]:
+    def bench_model_forward() -> Tuple[Callable, int]:
+        import torch
+        from gomoku.nn.gomoku_model import GomokuModel
+
+        torch.manual_seed(SEED)
+        model = GomokuModel(BOARD_SIZE, BOARD_SIZE * BOARD_SIZE)
+        x = torch.from_numpy(np.stack([midgame_board(seed=i).get_board() for i in range(batch_size)])).float()[:, None]
+
+        def run():
+            with torch.no_grad():
+                model(x)
+        return run, 20
+    return bench_model_forward
+
+
+def make_bench_numpy_model_forward(batch_size: int) -> Callable[[], Tuple[Callable, int]]:
+    def bench_numpy_model_forward() -> Tuple[Callable, int]:
+        import torch
+        from gomoku.nn.gomoku_model import GomokuModel
+        from gomoku.nn.numpy_model import NumpyGomokuModel, export_npz
+
+        torch.manual_seed(SEED)
+        buffer = io.BytesIO()
+        export_npz(GomokuModel(BOARD_SIZE, BOARD_SIZE * BOARD_SIZE), buffer)
+        buffer.seek(0)
+        model = NumpyGomokuModel.load(buffer)
+        x = np.stack([midgame_board(seed=i).get_board() for i in range(batch_size)]).astype(np.float32)[:, None]
+
+        def run():
+            model(x)
+        return run, 20
+    return bench_numpy_model_forward
+
+
+BENCHMARKS: Dict[str, Callable[[], Tuple[Callable, int]]] = {
+    "board_play": bench_board_play,
+    "board_check_game_ended": bench_board_check_game_ended,
+    "board_clone": bench_board_clone,
+    "env_all_valid_actions": bench_env_all_valid_actions,
+    "mcts_expand": bench_mcts_expand,
+    "mcts_select_node": bench_mcts_select_node,
+    "mcts_search_50": make_bench_search(50),
+    "mcts_search_200": make_bench_search(200),
+    "selfplay_game_9x9": bench_selfplay_game,
+    "model_forward_b1": make_bench_model_forward(1),
+    "model_forward_b16": make_bench_model_forward(16),
+    "model_forward_b64": make_bench_model_forward(64),
+    "model_forward_b225": make_bench_model_forward(225),
+    "numpy_model_forward_b1": make_bench_numpy_model_forward(1),
+    "numpy_model_forward_b16": make_bench_numpy_model_forward(16),
+    "numpy_model_forward_b64": make_bench_numpy_model_forward(64),
+    "numpy_model_forward_b225": make_bench_numpy_model_forward(225),
+}
+
+
+def run_benchmark(setup: Callable[[], Tuple[Callable, int]], repeats: int) -> float:
+    """
+    Return the median time (seconds) per call.
+    """
+    np.random.seed(SEED)
+    func, n_calls = setup()
+    func()  # Warm up
+    timings = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        for _ in range(n_calls):
+            func()
+        timings.append((time.perf_counter() - t0) / n_calls)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths and compare with the stored baseline.")
+    parser.add_argument("--filter", default="", help="Only run the benchmarks whose name contains this string")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown that is reported as a regression")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    regressions = []
+    print(f"{'benchmark':<26}{'time':>12}{'baseline':>12}{'ratio':>8}")
+    for name, setup in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        try:
+            seconds = run_benchmark(setup, args.repeats)
+        except ImportError as e:
+            print(f"{name:<26}{'skipped':>12}  ({e})")
+            continue
+        results[name] = seconds
+
+        line = f"{name:<26}{seconds * 1e3:>10.3f}ms"
+        if name in baseline:
+            ratio = seconds / baseline[name]
+            line += f"{baseline[name] * 1e3:>10.3f}ms{ratio:>8.2f}"
+            if ratio > 1 + args.threshold:
+                regressions.append(name)
+                line += "  REGRESSION"
+        print(line)
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "machine": {"platform": platform.platform(), "processor": platform.processor(), "python": platform.python_version()},
+                "results": baseline
+            }, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Import time and memory of the headless modules (the ones a self-play worker process loads).
+
+Usage (from the repository root):
+    python benchmarks/bench_import.py                     # run and compare with benchmarks/baseline.json
+    python benchmarks/bench_import.py --update-baseline   # run and store the results as the new baseline
+
+Every module is imported in a fresh interpreter. The exit code is 1 if a module pulls in a GUI or progress-bar library, or if
+its import time or peak RSS is worse than the baseline by more than --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+GUI_MODULES = ["PySide6", "gomoku.winui"]
+CORE_FORBIDDEN_MODULES = GUI_MODULES + ["tqdm", "torch"]
+
+# name -> (module, modules it must not load). torch itself imports tqdm, so tqdm is only checked for the torch-free modules
+# (the player and the distributed worker load torch only for the torch backend).
+MODULES = {
+    "board": ("gomoku.game.board", CORE_FORBIDDEN_MODULES),
+    "env": ("gomoku.reinforcement_learning.gomoku.gomoku_env", CORE_FORBIDDEN_MODULES),
+    "mcts": ("gomoku.reinforcement_learning.base.monte_carlo", CORE_FORBIDDEN_MODULES),
+    "numpy_model": ("gomoku.nn.numpy_model", CORE_FORBIDDEN_MODULES),
+    "player": ("gomoku.reinforcement_learning.gomoku.gomoku_player", CORE_FORBIDDEN_MODULES),
+    "distributed": ("gomoku.reinforcement_learning.gomoku.distributed", CORE_FORBIDDEN_MODULES),
+    "train": ("gomoku.reinforcement_learning.gomoku.gomoku_train", GUI_MODULES),
+}
+
+PROBE = """
+import json, resource, sys, time
+t0 = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - t0
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    "seconds": seconds,
+    "rss_mb": rss / (1 << 20) if sys.platform == "darwin" else rss / (1 << 10),
+    "forbidden": sorted({{name.split(".")[0] if not name.startswith("gomoku.") else ".".join(name.split(".")[:2])
+                         for name in sys.modules}} & set({forbidden}))
+}}))
+"""
+
+
+def measure(module: str, forbidden: list) -> dict:
+    """
+    Import the module in a new interpreter and return its import time (seconds), peak RSS (MB) and the forbidden modules loaded.
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, forbidden=forbidden)],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the import time and memory of the headless modules.")
+    parser.add_argument("--filter", default="", help="Only run the benchmarks whose name contains this string")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.3, help="Relative slowdown that is reported as a regression")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    failures = []
+    print(f"{'module':<14}{'time':>12}{'baseline':>12}{'rss':>10}{'baseline':>10}")
+    for name, (module, forbidden) in MODULES.items():
+        if args.filter not in name:
+            continue
+        try:
+            runs = [measure(module, forbidden) for _ in range(args.repeats)]
+        except subprocess.CalledProcessError as e:
+            print(f"{name:<14}{'skipped':>12}  ({e.stderr.strip().splitlines()[-1]})")
+            continue
+        seconds = min(run["seconds"] for run in runs)  # The minimum is the least noisy for import times
+        rss_mb = statistics.median(run["rss_mb"] for run in runs)
+        results[f"import_{name}_seconds"] = seconds
+        results[f"import_{name}_rss_mb"] = rss_mb
+
+        line = f"{name:<14}{seconds * 1e3:>10.1f}ms"
+        line += f"{baseline[f'import_{name}_seconds'] * 1e3:>10.1f}ms" if f"import_{name}_seconds" in baseline else " " * 12
+        line += f"{rss_mb:>8.1f}MB"
+        line += f"{baseline[f'import_{name}_rss_mb']:>8.1f}MB" if f"import_{name}_rss_mb" in baseline else " " * 10
+        for key, value in ((f"import_{name}_seconds", seconds), (f"import_{name}_rss_mb", rss_mb)):
+            if key in baseline and value > baseline[key] * (1 + args.threshold):
+                failures.append(key)
+                line += f"  REGRESSION ({key.rsplit('_', 1)[-1]})"
+        if runs[0]["forbidden"]:
+            failures.append(f"{name} imports {', '.join(runs[0]['forbidden'])}")
+            line += f"  IMPORTS {', '.join(runs[0]['forbidden'])}"
+        print(line)
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "machine": {"platform": platform.platform(), "processor": platform.processor(), "python": platform.python_version()},
+                "results": baseline
+            }, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif failures:
+        print(f"{len(failures)} failure(s): {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+from typing import List, Optional
+import json
+import os
+
+import numpy as np
+
+
+class GameArchiveWriter:
+    """
+    Append games (move lists) to an archive directory:
+    * moves.bin: the actions (board_size * x + y) of all the games, int16, one game after another
+    * index.npy: [n_games, 3] int64, (offset in moves.bin, number of moves, winner) of each game
+    * meta.json: {"board_size": ...}
+    If the archive already exists, the games are appended.
+    """
+    def __init__(self, path: str, board_size: int):
+        self.path = path
+        self.board_size = board_size
+        os.makedirs(path, exist_ok=True)
+
+        meta_path = os.path.join(path, "meta.json")
+        index_path = os.path.join(path, "index.npy")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                if json.load(f)["board_size"] != board_size:
+                    raise ValueError(f"The archive {path} has a different board size")
+        else:
+            with open(meta_path, "w") as f:
+                json.dump({"board_size": board_size}, f)
+        self.index: List[List[int]] = np.load(index_path).tolist() if os.path.exists(index_path) else []
+        self.offset = sum(length for _, length, _ in self.index)
+
+        self.moves_file = open(os.path.join(path, "moves.bin"), "ab")
+        self.moves_file.truncate(self.offset * 2)  # Drop the moves written after the last flush of the index
+
+    def add_game(self, moves: List[int], winner: Optional[int]):
+        self.moves_file.write(np.asarray(moves, dtype=np.int16).tobytes())
+        self.index.append([self.offset, len(moves), winner or 0])
+        self.offset += len(moves)
+
+    def flush(self):
+        """
+        Write the index of the added games. The moves are flushed first, and the new index replaces the old one atomically, so
+        a reader opening the archive meanwhile sees either the old or the new index, never a partly written one.
+        """
+        self.moves_file.flush()
+        index_path = os.path.join(self.path, "index.npy")
+        with open(index_path + ".tmp", "wb") as f:
+            np.save(f, np.array(self.index, dtype=np.int64).reshape(-1, 3))
+        os.replace(index_path + ".tmp", index_path)
+
+    def close(self):
+        self.flush()
+        self.moves_file.close()
+
+
+class GameArchive:
+    """
+    Read an archive written by `GameArchiveWriter`. The moves are memory-mapped, so opening an archive and listing its games
+    does not load the games; a position is reconstructed from the move list only when it is requested. The index (24 bytes per
+    game) is read at once and not kept open, so that a running writer can replace it.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.board_size = json.load(f)["board_size"]
+
+        index_path = os.path.join(path, "index.npy")
+        self.index = np.load(index_path) if os.path.exists(index_path) else np.zeros((0, 3), dtype=np.int64)
+        moves_path = os.path.join(path, "moves.bin")
+        if os.path.getsize(moves_path) > 0:
+            self.moves = np.memmap(moves_path, dtype=np.int16, mode="r")
+        else:
+            self.moves = np.zeros(0, dtype=np.int16)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def game_length(self, i: int) -> int:
+        return int(self.index[i, 1])
+
+    def winner(self, i: int) -> int:
+        """
+        Return: 1 or -1, 0 for a draw.
+        """
+        return int(self.index[i, 2])
+
+    def game_moves(self, i: int) -> np.ndarray:
+        offset, length, _ = self.index[i]
+        return self.moves[offset:offset + length]
+
+    def action(self, i: int, step: int) -> tuple[int, int]:
+        """
+        Return: the (x, y) of the `step`-th move (starting from 1) of the game `i`.
+        """
+        action = int(self.game_moves(i)[step - 1])
+        return action // self.board_size, action % self.board_size
+
+    def position(self, i: int, step: int) -> np.ndarray:
+        """
+        Return: the board after the first `step` moves of the game `i`.
+        """
+        return moves_to_board(self.game_moves(i)[:step], self.board_size)
+
+
+def moves_to_board(moves: np.ndarray, board_size: int) -> np.ndarray:
+    """
+    Replay the moves on an empty board. The first player (black) is 1.
+    """
+    board = np.zeros(board_size * board_size, dtype=np.int8)
+    board[moves[0::2]] = 1
+    board[moves[1::2]] = -1
+    return board.reshape(board_size, board_size)
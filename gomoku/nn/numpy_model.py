@@ -0,0 +1,79 @@
+"""
+Inference of `GomokuModel` with numpy only, so that self-play workers and game servers don't need PyTorch.
+
+    export_npz(model, "model.npz")                  # where torch is available
+    model = NumpyGomokuModel.load("model.npz")      # anywhere
+    logits, values = model(states[:, None])
+"""
+from typing import Dict, Tuple
+
+import numpy as np
+
+
+CONV_LAYERS = [("conv1", 1), ("conv2", 2), ("conv3", 2)]  # (name, stride), all with kernel size 3 and padding 1
+DENSE_LAYERS = ["fc1", "output_actions", "output_value"]
+
+
+def export_npz(model, path):
+    """
+    Save the weights of a `GomokuModel` to an .npz file (path can also be a file object).
+    """
+    weights = {name: tensor.detach().cpu().numpy() for name, tensor in model.state_dict().items()}
+    np.savez(path, board_size=model.board_size, n_actions=model.n_actions, **weights)
+
+
+def conv2d(x: np.ndarray, weight: np.ndarray, bias: np.ndarray, stride: int = 1, padding: int = 1) -> np.ndarray:
+    """
+    Same as torch.nn.functional.conv2d. The windows of the padded input are taken as a strided view (im2col without copying
+    before the product), and the convolution is a single tensordot.
+    x: [batch_size, in_channels, height, width], weight: [out_channels, in_channels, kh, kw]
+    """
+    batch_size, in_channels, height, width = x.shape
+    _, _, kh, kw = weight.shape
+    x = np.pad(x, ((0, 0), (0, 0), (padding, padding), (padding, padding)))
+    out_height = (height + 2 * padding - kh) // stride + 1
+    out_width = (width + 2 * padding - kw) // stride + 1
+    s_batch, s_channel, s_height, s_width = x.strides
+    windows = np.lib.stride_tricks.as_strided(
+        x,
+        shape=(batch_size, out_height, out_width, in_channels, kh, kw),
+        strides=(s_batch, s_height * stride, s_width * stride, s_channel, s_height, s_width),
+        writeable=False
+    )
+    out = np.tensordot(windows, weight, axes=([3, 4, 5], [1, 2, 3]))  # [batch_size, out_height, out_width, out_channels]
+    out += bias
+    return out.transpose(0, 3, 1, 2)
+
+
+class NumpyGomokuModel:
+    """
+    Same forward pass as `GomokuModel`, computed in float32 with numpy.
+    """
+    def __init__(self, board_size: int, n_actions: int, weights: Dict[str, np.ndarray]):
+        self.board_size = board_size
+        self.n_actions = n_actions
+        self.weights = {name: np.ascontiguousarray(value, dtype=np.float32) for name, value in weights.items()}
+        # Transposed once, so that the dense layers are x @ weight
+        for name in DENSE_LAYERS:
+            self.weights[f"{name}.weight_t"] = np.ascontiguousarray(self.weights[f"{name}.weight"].T)
+
+    @classmethod
+    def load(cls, path) -> "NumpyGomokuModel":
+        data = np.load(path)
+        weights = {name: data[name] for name in data.files if name not in ("board_size", "n_actions")}
+        return cls(int(data["board_size"]), int(data["n_actions"]), weights)
+
+    def dense(self, x: np.ndarray, name: str) -> np.ndarray:
+        return x @ self.weights[f"{name}.weight_t"] + self.weights[f"{name}.bias"]
+
+    def __call__(self, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        x: [batch_size, 1, board_size, board_size]
+        Return: the action logits [batch_size, n_actions] and the values [batch_size, 1]
+        """
+        x = np.asarray(x, dtype=np.float32)
+        for name, stride in CONV_LAYERS:
+            x = conv2d(x, self.weights[f"{name}.weight"], self.weights[f"{name}.bias"], stride)
+        x = x.reshape(len(x), -1)
+        x = self.dense(x, "fc1")
+        return self.dense(x, "output_actions"), np.tanh(self.dense(x, "output_value"))
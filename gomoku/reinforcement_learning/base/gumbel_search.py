@@ -0,0 +1,103 @@
+from typing import Tuple
+import math
+
+import numpy as np
+
+from gomoku.reinforcement_learning.base.monte_carlo import MCTSNode, expand, run_simulation
+from gomoku.reinforcement_learning.base.trace import SearchTracer
+
+
+class GumbelRootSearch:
+    """
+    Root search of Gumbel AlphaZero ("Policy improvement by planning with Gumbel", Danihelka et al., 2022), which improves the
+    policy even with a few (16 ~ 64) simulations per step:
+    1. Sample the `max_considered_actions` best actions by Gumbel noise + prior logits (Gumbel-top-k).
+    2. Sequential halving: split the simulations into log2(k) phases, visit the remaining actions equally in each phase and
+       keep the better half by gumbel + logits + sigma(q).
+    3. Play the remaining action, and use softmax(logits + sigma(completed q)) as the policy training target.
+
+    Use an instance as `root_search` of `alphazero_play_one_game`. The simulations inside the subtrees of the root children
+    use PUCT with `c_puct`.
+    """
+    def __init__(self, n_simulations: int, c_puct: float, max_considered_actions: int = 16,
+                 c_visit: float = 50.0, c_scale: float = 1.0, seed: int = None):
+        self.n_simulations = n_simulations
+        self.c_puct = c_puct
+        self.max_considered_actions = max_considered_actions
+        self.c_visit = c_visit
+        self.c_scale = c_scale
+        self.rng = np.random.default_rng(seed)
+
+    def sigma(self, q: np.ndarray, max_visits: int) -> np.ndarray:
+        """
+        Monotonic transformation of the q values (in [0, 1]).
+        """
+        return (self.c_visit + max_visits) * self.c_scale * q
+
+    def __call__(self, root: MCTSNode, tracer: SearchTracer = None) -> Tuple[MCTSNode, np.ndarray]:
+        player = root.game.get_next_player()
+        n_used = 0
+        if root.is_leaf:
+            expand(root, player)
+            root.simulation()
+            n_used += 1
+        children = root.children
+        actions = np.array([child.game.env.get_last_action() for child in children])
+        n_actions = len(root.game.env.action_space())
+
+        policy = player.policy_generator(root.get_state())
+        logits = np.log(np.asarray(policy, dtype=np.float64).flatten()[actions] + 1e-8)
+        gumbel = self.rng.gumbel(size=len(children))
+
+        def q_values() -> Tuple[np.ndarray, np.ndarray]:
+            """
+            Return: the visits and the mean values (in [0, 1], from the view of the player choosing at the root) of the children
+            """
+            visits = np.array([child.visits for child in children])
+            totals = np.array([child.total_action_value for child in children])
+            return visits, (-totals / np.maximum(visits, 1) + 1) / 2
+
+        # Gumbel-top-k
+        considered = list(np.argsort(-(gumbel + logits))[:min(self.max_considered_actions, len(children))])
+
+        # Sequential halving. Every phase gets an equal share of the simulations left, the last phase gets all of them.
+        n_phases_left = max(1, math.ceil(math.log2(len(considered))))
+        while len(considered) > 1 and n_used < self.n_simulations:
+            n_left = self.n_simulations - n_used
+            if n_phases_left == 1:
+                visits_per_action = math.ceil(n_left / len(considered))
+            else:
+                visits_per_action = max(1, n_left // n_phases_left // len(considered))
+            for i in considered:
+                for _ in range(visits_per_action):
+                    if n_used == self.n_simulations:
+                        break
+                    run_simulation(children[i], player, self.c_puct, tracer)
+                    n_used += 1
+            n_phases_left = max(1, n_phases_left - 1)
+            visits, q = q_values()
+            scores = gumbel + logits + self.sigma(q, visits.max()) * (visits > 0)
+            considered = sorted(considered, key=lambda i: -scores[i])[:math.ceil(len(considered) / 2)]
+
+        visits, q = q_values()
+        scores = gumbel + logits + self.sigma(q, visits.max()) * (visits > 0)
+        selected = max(considered, key=lambda i: scores[i])
+
+        # Completed q: the unvisited actions get the mixed value of the root value and the policy-weighted visited q values
+        probs = np.exp(logits - logits.max())
+        probs /= probs.sum()
+        root_value = (root.total_action_value / root.visits + 1) / 2 if root.visits > 0 else 0.5
+        visited = visits > 0
+        if visited.any():
+            weighted_q = np.sum(probs[visited] * q[visited]) / np.sum(probs[visited])
+            mixed_value = (root_value + visits.sum() * weighted_q) / (1 + visits.sum())
+        else:
+            mixed_value = root_value
+        completed_q = np.where(visited, q, mixed_value)
+
+        improved_logits = logits + self.sigma(completed_q, visits.max())
+        improved = np.exp(improved_logits - improved_logits.max())
+        improved_policy = np.zeros(n_actions, dtype=np.float32)
+        improved_policy[actions] = improved / improved.sum()
+
+        return children[selected], improved_policy
@@ -0,0 +1,74 @@
+from typing import Tuple, List, Any, Callable
+import time
+
+import numpy as np
+
+from gomoku.reinforcement_learning.base.player import Game
+from gomoku.reinforcement_learning.base.metrics import metrics
+from gomoku.reinforcement_learning.base.trace import SearchTracer
+from gomoku.reinforcement_learning.base.monte_carlo import MCTSNode, alphazero_game_coroutine
+
+
+def lockstep_play_games(
+        initial_games: List[Game], simulations_per_step: int, c_puct: float,
+        value_estimator: Callable[[np.ndarray], np.ndarray] = None,
+        callbacks_per_step: List[Callable[[Game], None]] = None,
+        opening_book = None,
+        tracer: SearchTracer = None
+    ) -> List[Tuple[List[Tuple[Any, np.ndarray, float]], List[MCTSNode]]]:
+    """
+    Play several games at once in a single process. The searches of all the games advance together (`alphazero_game_coroutine`),
+    and in every round the states requested by all the games are evaluated in one `value_estimator` call, so the NN runs with
+    large batches.
+    value_estimator: shared by all the games (default: the one of the first player of the first game).
+    callbacks_per_step: one callback (or None) for every game.
+    tracer: records the search of the first game only.
+    Return: the results of `alphazero_play_one_game` for every game.
+    """
+    if value_estimator is None:
+        value_estimator = initial_games[0].players[0].value_estimator
+
+    if callbacks_per_step is None:
+        callbacks_per_step = [None] * len(initial_games)
+
+    coroutines = [
+        alphazero_game_coroutine(
+            game, simulations_per_step, c_puct, callback_per_step=callback_per_step, tracer=tracer if i == 0 else None,
+            opening_book=opening_book
+        )
+        for i, (game, callback_per_step) in enumerate(zip(initial_games, callbacks_per_step))
+    ]
+    results = [None] * len(coroutines)
+    pending = dict()  # game index -> states to evaluate ([selected leaf, its new children...])
+
+    def request_states(request) -> np.ndarray:
+        _, node, children = request
+        return np.array([node.get_state()] + [child.get_state() for child in children])
+
+    for i, coroutine in enumerate(coroutines):
+        try:
+            pending[i] = request_states(next(coroutine))
+        except StopIteration as stop:
+            results[i] = stop.value
+
+    while pending:
+        indices = list(pending)
+        batch = np.concatenate([pending[i] for i in indices])
+        t0 = time.perf_counter()
+        values = value_estimator(batch)
+        evaluation_seconds = time.perf_counter() - t0
+        metrics.add_time("nn_forward", evaluation_seconds)
+        metrics.observe("nn_batch_size", len(batch))
+
+        offset = 0
+        for i in indices:
+            n = len(pending[i])
+            try:
+                # Every game is charged its share of the batch
+                pending[i] = request_states(coroutines[i].send((values[offset:offset + n], evaluation_seconds * n / len(batch))))
+            except StopIteration as stop:
+                results[i] = stop.value
+                del pending[i]
+            offset += n
+
+    return results
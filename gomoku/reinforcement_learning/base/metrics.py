@@ -0,0 +1,167 @@
+from typing import Dict, List
+from collections import defaultdict
+from contextlib import contextmanager
+import csv
+import json
+import os
+import time
+
+
+class Metrics:
+    """
+    Low-overhead counters, timers and value statistics.
+
+    * counters: monotonically increasing integers (e.g. nodes allocated)
+    * timers:   accumulated seconds and number of calls (e.g. select / expand / nn_forward)
+    * values:   count / sum / min / max of observed values (e.g. NN batch sizes)
+
+    A snapshot is a plain dict, so snapshots from several workers can be merged with `merge_snapshots`.
+    """
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.timer_seconds: Dict[str, float] = defaultdict(float)
+        self.timer_calls: Dict[str, int] = defaultdict(int)
+        self.values: Dict[str, List[float]] = dict()  # name -> [count, sum, min, max]
+        self.start_time = time.time()
+
+    def count(self, name: str, n: int = 1):
+        if not self.enabled:
+            return
+        self.counters[name] += n
+
+    def add_time(self, name: str, seconds: float):
+        """
+        Add a measured duration. Prefer this over `timer` in the hot loops, where the context manager overhead matters.
+        """
+        if not self.enabled:
+            return
+        self.timer_seconds[name] += seconds
+        self.timer_calls[name] += 1
+
+    @contextmanager
+    def timer(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - t0)
+
+    def observe(self, name: str, value: float):
+        if not self.enabled:
+            return
+        stat = self.values.get(name)
+        if stat is None:
+            self.values[name] = [1, value, value, value]
+        else:
+            stat[0] += 1
+            stat[1] += value
+            stat[2] = min(stat[2], value)
+            stat[3] = max(stat[3], value)
+
+    def snapshot(self) -> dict:
+        """
+        Return the current metrics as a JSON-serializable dict.
+        """
+        return {
+            "timestamp": time.time(),
+            "elapsed": time.time() - self.start_time,
+            "counters": dict(self.counters),
+            "timers": {name: {"seconds": self.timer_seconds[name], "calls": self.timer_calls[name]} for name in self.timer_seconds},
+            "values": {name: {"count": c, "sum": s, "min": lo, "max": hi} for name, (c, s, lo, hi) in self.values.items()},
+        }
+
+
+def merge_snapshots(snapshots: List[dict]) -> dict:
+    """
+    Aggregate the snapshots of several workers into one snapshot.
+    """
+    merged = {"timestamp": 0.0, "elapsed": 0.0, "counters": {}, "timers": {}, "values": {}}
+    for snapshot in snapshots:
+        merged["timestamp"] = max(merged["timestamp"], snapshot["timestamp"])
+        merged["elapsed"] = max(merged["elapsed"], snapshot["elapsed"])
+        for name, n in snapshot["counters"].items():
+            merged["counters"][name] = merged["counters"].get(name, 0) + n
+        for name, timer in snapshot["timers"].items():
+            total = merged["timers"].setdefault(name, {"seconds": 0.0, "calls": 0})
+            total["seconds"] += timer["seconds"]
+            total["calls"] += timer["calls"]
+        for name, value in snapshot["values"].items():
+            if name not in merged["values"]:
+                merged["values"][name] = dict(value)
+            else:
+                total = merged["values"][name]
+                total["count"] += value["count"]
+                total["sum"] += value["sum"]
+                total["min"] = min(total["min"], value["min"])
+                total["max"] = max(total["max"], value["max"])
+    return merged
+
+
+def snapshot_rows(snapshot: dict) -> List[dict]:
+    """
+    Flatten a snapshot into rows of (kind, name, count, total, mean, min, max), which is convenient for CSV files.
+    """
+    rows = []
+    for name, n in sorted(snapshot["counters"].items()):
+        rows.append({"kind": "counter", "name": name, "count": n, "total": n, "mean": "", "min": "", "max": ""})
+    for name, timer in sorted(snapshot["timers"].items()):
+        mean = timer["seconds"] / timer["calls"] if timer["calls"] else 0.0
+        rows.append({"kind": "timer", "name": name, "count": timer["calls"], "total": timer["seconds"], "mean": mean, "min": "", "max": ""})
+    for name, value in sorted(snapshot["values"].items()):
+        mean = value["sum"] / value["count"] if value["count"] else 0.0
+        rows.append({"kind": "value", "name": name, "count": value["count"], "total": value["sum"], "mean": mean, "min": value["min"], "max": value["max"]})
+    return rows
+
+
+def export_json(snapshot: dict, path: str):
+    with open(path, "w") as f:
+        json.dump(snapshot, f, indent=2)
+
+
+def export_csv(snapshot: dict, path: str, append: bool = False):
+    """
+    Write the snapshot as CSV. With `append`, rows are added to an existing file, so that the file holds a time series.
+    """
+    write_header = not (append and os.path.exists(path))
+    with open(path, "a" if append else "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["timestamp", "kind", "name", "count", "total", "mean", "min", "max"])
+        if write_header:
+            writer.writeheader()
+        for row in snapshot_rows(snapshot):
+            writer.writerow({"timestamp": snapshot["timestamp"], **row})
+
+
+class SnapshotExporter:
+    """
+    Export snapshots of `metrics` (or of any object with a `snapshot()` method, e.g. the merged metrics of the distributed
+    self-play workers) at most once every `interval` seconds.
+    The file format is chosen by the suffix of `path` (.json or .csv). JSON files are overwritten, CSV files are appended.
+    """
+    def __init__(self, metrics: Metrics, path: str, interval: float = 60.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.last_export = 0.0
+
+    def maybe_export(self, force: bool = False) -> bool:
+        now = time.time()
+        if not force and now - self.last_export < self.interval:
+            return False
+        self.last_export = now
+        snapshot = self.metrics.snapshot()
+        if self.path.endswith(".csv"):
+            export_csv(snapshot, self.path, append=True)
+        else:
+            export_json(snapshot, self.path)
+        return True
+
+
+# The process-wide metrics used by the search and the trainer
+metrics = Metrics()
@@ -1,9 +1,10 @@
-from typing import Tuple, List, Any, Callable
-from tqdm import tqdm
+from typing import Tuple, List, Any, Callable, Generator
 import time
 import numpy as np
 
 from gomoku.reinforcement_learning.base.player import Game, IntuitivePlayer
+from gomoku.reinforcement_learning.base.metrics import metrics
+from gomoku.reinforcement_learning.base.trace import SearchTracer
 
 
 class MCTSNode:
@@ -23,7 +24,7 @@ class MCTSNode:
         self.prior_mean_value = prior_mean_value
 
         self.is_leaf = True
-
+        metrics.count("nodes_allocated")
 
     def get_state(self) -> np.ndarray:
         """
@@ -33,8 +34,18 @@ class MCTSNode:
 
     def simulation(self):
         # Use the NN to estimate the value of the current state
+        t0 = time.perf_counter()
         estimated_value = self.game.get_next_player().value_estimator(self.get_state()[None])[0]
+        t1 = time.perf_counter()
+        metrics.add_time("nn_forward", t1 - t0)
+        metrics.observe("nn_batch_size", 1)
+
+        self.backup(estimated_value)
+        metrics.add_time("backup", time.perf_counter() - t1)
+
+        return True
 
+    def backup(self, estimated_value: float):
         # When the result is simulated, the value is set to 1 for the current player and -1 for the opponent.
         # The backup node will be updated with the value of the simulated game.
         backup_node = self
@@ -44,8 +55,6 @@ class MCTSNode:
             backup_node.visits += 1
             backup_node = backup_node.parent
 
-        return True
-
 
 def select_node(node: MCTSNode, c_puct: float) -> MCTSNode:
     """
@@ -61,89 +70,284 @@ def select_node(node: MCTSNode, c_puct: float) -> MCTSNode:
         return select_node(best_child, c_puct)
 
 
+def create_children(node: MCTSNode) -> List[MCTSNode]:
+    """
+    Create the children of a leaf node, without their prior values. Nodes of ended games get no children.
+    The node stays a leaf until its children get their prior values.
+    """
+    if not node.is_leaf or node.children or node.game.env.is_end():
+        return []
+    for action in node.game.env.all_valid_actions():
+        new_game = node.game.clone()
+        new_game.env.play(action)
+        new_game.env.trim_history()
+        node.children.append(MCTSNode(new_game, parent=node))
+    return node.children
+
+
 def expand(node: MCTSNode, player: IntuitivePlayer):
     """
-    Expand the node by generating its children.
+    Expand the node by generating its children. Nodes of ended games stay leaves.
     """
-    if not node.is_leaf:
+    if not create_children(node):
         return False
     else:
-        for action in node.game.env.all_valid_actions():
-            new_game = node.game.clone()
-            new_game.env.play(action)
+        set_priors(node, estimate_children_values(node, player))
+        return True
+
+
+def estimate_children_values(node: MCTSNode, player: IntuitivePlayer) -> np.ndarray:
+    """
+    Estimate the values of the children of the node in one batch, incrementally if the player supports it.
+    """
+    t0 = time.perf_counter()
+    if player.children_value_estimator is not None:
+        actions = np.array([child.game.env.get_last_action() for child in node.children])
+        values = player.children_value_estimator(node.get_state(), actions)
+    else:
+        values = player.value_estimator(np.array([child.get_state() for child in node.children]))
+    metrics.add_time("nn_forward", time.perf_counter() - t0)
+    metrics.observe("nn_batch_size", len(node.children))
+    return values
+
+
+def set_priors(node: MCTSNode, children_values: np.ndarray):
+    """
+    Set the prior values of the children created by `create_children`, which makes the node an inner node.
+    """
+    for child, prior_mean_value in zip(node.children, children_values):
+        child.prior_mean_value = prior_mean_value
+    node.is_leaf = False
+
+
+def mean_action_value(child: MCTSNode) -> float:
+    """
+    The mean action value of the child from the view of the player choosing at its parent.
+    (`total_action_value` of a node is accumulated from the view of the opponent of that player.)
+    """
+    return -child.total_action_value / (child.visits + 1)
+
+
+def policy_target(node: MCTSNode) -> np.ndarray:
+    """
+    The training target of the policy at the node: softmax of the mean action values of its children.
+    """
+    action_space = node.game.env.action_space()
+    action_values = np.array([-1] * len(action_space), dtype=np.float32)  # Invalid steps: action_value = -1（表示当前玩家输了）
+    for child in node.children:
+        action_values[np.where(action_space == child.game.env.get_last_action())[0][0]] = mean_action_value(child)
+    return np.exp(action_values) / np.sum(np.exp(action_values))
+
+
+def run_simulation(node: MCTSNode, player: IntuitivePlayer, c_puct: float, tracer: SearchTracer = None):
+    """
+    Run one simulation (select, expand, simulate) in the subtree of the node.
+    The expand timer only covers building the tree. The simulate timer covers the NN evaluation of the new children and of
+    the leaf (also reported as nn_forward) and the backup (also reported as backup), like in `alphazero_game_coroutine`.
+    """
+    t0 = time.perf_counter()
+    # Select the node to expand
+    selected_node: MCTSNode = select_node(node, c_puct)
+    t1 = time.perf_counter()
+    # Expand the node
+    children = create_children(selected_node)
+    t_created = time.perf_counter()
+    children_values = estimate_children_values(selected_node, player) if children else None
+    t_evaluated = time.perf_counter()
+    if children:
+        set_priors(selected_node, children_values)
+    t2 = time.perf_counter()
+    # Simulate the game from the expanded node
+    selected_node.simulation()
+    t3 = time.perf_counter()
+    expand_seconds = (t_created - t1) + (t2 - t_evaluated)
+    simulate_seconds = (t_evaluated - t_created) + (t3 - t2)
+    metrics.add_time("select", t1 - t0)
+    metrics.add_time("expand", expand_seconds)
+    metrics.add_time("simulate", simulate_seconds)
+    metrics.count("simulations")
+    if tracer is not None:
+        tracer.record_simulation(t0, t1 - t0, expand_seconds, simulate_seconds, len(children))
+
+
+def alphazero_game_coroutine(
+        initial_game: Game, simulations_per_step: int, c_puct: float,
+        verbose: bool = False,
+        callback_per_step: Callable[[Game], None] = None,
+        tracer: SearchTracer = None,
+        opening_book = None,
+        root_search: Callable[[MCTSNode, SearchTracer], Tuple[MCTSNode, np.ndarray]] = None
+    ) -> Generator[Tuple[IntuitivePlayer, MCTSNode, List[MCTSNode]], np.ndarray, Tuple[List[Tuple[Any, np.ndarray, float]], List[MCTSNode]]]:
+    """
+    The game loop of AlphaZero self-play, without the NN: every PUCT simulation yields (searching player, selected leaf, its
+    new children) and is resumed with (their values [leaf value, children values...], the seconds spent evaluating them).
+    `alphazero_play_one_game` drives it for one game, `lockstep_play_games` evaluates the requests of several games in one
+    batch. The timers mean the same as in `run_simulation`: the time spent in the driver between the yield and the resume
+    (the other games of a lockstep batch) is in none of them, the evaluation seconds are part of simulate.
+    See `alphazero_play_one_game` for the arguments and the result. With `root_search`, the steps are searched by it directly,
+    without yielding.
+    """
+    step_nodes = [MCTSNode(initial_game)]
+    step_policies = []  # The policy training target of every step
+    t_start = time.time()
+    if tracer is not None:
+        tracer.begin_game()
+    while not step_nodes[-1].game.env.is_end():
+        if verbose:
+            print(f"Step: {len(step_nodes)}, {time.time() - t_start:7.2f}s", end="\r")
+        root = step_nodes[-1]
+
+        book_policy = opening_book.probe(root.game.env) if opening_book is not None else None
+        if book_policy is not None:
+            metrics.count("book_hits")
+            new_game = root.game.clone()
+            new_game.env.play(opening_book.choose(book_policy))
             new_game.env.trim_history()
-            child_node = MCTSNode(new_game, parent=node)
-            node.children.append(child_node)
+            step_policies.append(book_policy)
+            step_nodes.append(MCTSNode(new_game, parent=root))
+            if callback_per_step is not None:
+                callback_per_step(step_nodes[-1].game.env)
+            continue
 
-        children_states = np.array([child.get_state() for child in node.children])
-        children_prior_mean_values = player.value_estimator(children_states)
-        for child, prior_mean_value in zip(node.children, children_prior_mean_values):
-            child.prior_mean_value = prior_mean_value
+        if root_search is not None:
+            selected_child, policy = root_search(root, tracer)
+        else:
+            player = root.game.get_next_player()
+            for _ in range(simulations_per_step):
+                t0 = time.perf_counter()
+                selected_node = select_node(root, c_puct)
+                t1 = time.perf_counter()
+                children = create_children(selected_node)
+                t_yield = time.perf_counter()
+                values, evaluation_seconds = yield player, selected_node, children
+                t_resume = time.perf_counter()
+                if children:
+                    set_priors(selected_node, values[1:])
+                t2 = time.perf_counter()
+                selected_node.backup(values[0])
+                t3 = time.perf_counter()
+                expand_seconds = (t_yield - t1) + (t2 - t_resume)
+                simulate_seconds = evaluation_seconds + (t3 - t2)
+                metrics.add_time("select", t1 - t0)
+                metrics.add_time("expand", expand_seconds)
+                metrics.add_time("simulate", simulate_seconds)
+                metrics.add_time("backup", t3 - t2)
+                metrics.count("simulations")
+                if tracer is not None:
+                    tracer.record_simulation(t0, t1 - t0, expand_seconds, simulate_seconds, len(children))
+            selected_child, policy = max(root.children, key=mean_action_value), policy_target(root)
 
-        node.is_leaf = False
-        return True
+        step_policies.append(policy)
+        metrics.count("moves")
+        if tracer is not None:
+            tracer.record_move(root, selected_child)
+        root.children.clear()  # Delete the children of the node, since they will not be used again. Otherwise, memory will overflow.
+        step_nodes.append(selected_child)
+
+        if callback_per_step is not None:
+            callback_per_step(step_nodes[-1].game.env)
+
+    metrics.count("games")
+    return training_data(step_nodes, step_policies), step_nodes
 
 
 def alphazero_play_one_game(
         initial_game: Game, simulations_per_step: int, c_puct: float, 
         verbose: bool = True, 
-        callback_per_step: Callable[[Game], None] = None
+        callback_per_step: Callable[[Game], None] = None,
+        tracer: SearchTracer = None,
+        opening_book = None,
+        root_search: Callable[[MCTSNode, SearchTracer], Tuple[MCTSNode, np.ndarray]] = None
     ) -> Tuple[List[Tuple[Any, np.ndarray, float]], List[MCTSNode]]:
     """
     Play one game using MCTS.
+    If `tracer` is given, the statistics of the search of every move are recorded into it.
+    If `opening_book` is given, it is consulted before searching: opening_book.probe(env) returns a policy over the action
+    space (or None if the position is not in the book), and opening_book.choose(policy) picks the action. The book policy is
+    used as the training target of that step.
+    `root_search(root, tracer)` searches at every step and returns the child to play and the policy training target.
+    By default, the root is searched with PUCT, `simulations_per_step` simulations and `c_puct`.
     """
-    step_nodes = [MCTSNode(initial_game)]
     print("Start playing one game...")
-    t0 = time.time()
-    while not step_nodes[-1].game.env.is_end():
-        if verbose:
-            print(f"Step: {len(step_nodes)}, {time.time() - t0:7.2f}s", end="\r")
-        for _ in range(simulations_per_step):
-            # Select the node to expand
-            selected_node: MCTSNode = select_node(step_nodes[-1], c_puct)
-            # Expand the node
-            expand(selected_node, step_nodes[-1].game.get_next_player())
-            # Simulate the game from the expanded node
-            selected_node.simulation()
-            # Check if the root node has been fully expanded
-
-        selected_child = max(step_nodes[-1].children, key=lambda child: child.total_action_value / (child.visits+1))
-        step_nodes[-1].children.clear()  # Delete the children of the node, since they will not be used again. Otherwise, memory will overflow.
-        step_nodes.append(selected_child)
+    coroutine = alphazero_game_coroutine(
+        initial_game, simulations_per_step, c_puct, verbose, callback_per_step, tracer, opening_book, root_search
+    )
+    try:
+        player, node, children = next(coroutine)
+        while True:
+            # Same evaluations as `run_simulation`
+            t0 = time.perf_counter()
+            children_values = estimate_children_values(node, player) if children else np.zeros(0, dtype=np.float32)
+            t1 = time.perf_counter()
+            value = node.game.get_next_player().value_estimator(node.get_state()[None])[0]
+            t2 = time.perf_counter()
+            metrics.add_time("nn_forward", t2 - t1)
+            metrics.observe("nn_batch_size", 1)
+            player, node, children = coroutine.send((np.concatenate([[value], children_values]), t2 - t0))
+    except StopIteration as stop:
+        return stop.value
 
-        if callback_per_step is not None:
-            callback_per_step(step_nodes[-1].game.env)
-        
 
+def training_data(step_nodes: List[MCTSNode], step_policies: List[np.ndarray]) -> List[Tuple[Any, np.ndarray, float]]:
+    """
+    Convert a played game into [[state, action_probs, value], ...].
+    """
     winner = step_nodes[-1].game.env.winner()
     if winner is None:
         winner = 0
 
     state_actionProbs_value: List[Tuple[Any, np.ndarray, float]] = []
     for i in range(0, len(step_nodes) - 1):
-        action_probs = np.array([-1] * len(step_nodes[i].game.env.action_space()), dtype=np.float32)  # Invalid steps: action_value = 上个玩家ID（表示当前玩家输了）
-        for child in step_nodes[i].children:
-            action_probs[np.where(step_nodes[i].game.env.action_space() == child.game.env.get_last_action())[0][0]] = child.total_action_value / (child.visits+1)
-        action_probs = np.exp(action_probs) / np.sum(np.exp(action_probs))
-        state_actionProbs_value.append((step_nodes[i].get_state(), action_probs, winner))  # [[state, action_probs, value], ...]
+        # The value is from the view of the player whose stones are 1 in the state, i.e. the player who moved last
+        value = winner * step_nodes[i].game.env.get_next_player_id()
+        state_actionProbs_value.append((step_nodes[i].get_state(), step_policies[i], value))  # [[state, action_probs, value], ...]
+
+    return state_actionProbs_value
 
-    return state_actionProbs_value, step_nodes
 
 
+def visit_distribution(node: MCTSNode, n_actions: int) -> np.ndarray:
+    """
+    Get the visit counts of the children of the node, indexed by action.
+    """
+    visits = np.zeros(n_actions, dtype=np.int64)
+    for child in node.children:
+        visits[child.game.env.get_last_action()] = child.visits
+    return visits
+
 
 class MCTSPlayer:
-    def __init__(self, intuitive_player: IntuitivePlayer):
+    def __init__(self, intuitive_player: IntuitivePlayer, c_puct: float = 5.0, opening_book = None):
+        """
+        opening_book: consulted before searching, see `alphazero_play_one_game`
+        """
         self.intuitive_player = intuitive_player
+        self.c_puct = c_puct
+        self.opening_book = opening_book
+
+    def play(self, game: Game, n_simulations: int, callback_per_simulation: Callable[[MCTSNode, int], bool] = None) -> Any:
+        """
+        Search and play the best action. Return the action.
+        callback_per_simulation(root, n_finished_simulations) is called after every simulation. If it returns False, the
+        search is cancelled and None is returned without playing.
+        """
+        if self.opening_book is not None:
+            book_policy = self.opening_book.probe(game.env)
+            if book_policy is not None:
+                metrics.count("book_hits")
+                action = self.opening_book.choose(book_policy)
+                game.play(action)
+                return action
 
-    def play(self, game: Game, n_simulations: int) -> Tuple[Any, np.ndarray, float]:
         node = MCTSNode(game)
 
-        for _ in range(n_simulations):
-            selected_node = select_node(node)
-            expand(selected_node, self.intuitive_player)
-            selected_node.simulation()
+        for i in range(n_simulations):
+            run_simulation(node, self.intuitive_player, self.c_puct)
+            if callback_per_simulation is not None and callback_per_simulation(node, i + 1) is False:
+                return None
         
         # Find the action with the best average action value
-        action = max(node.children, key=lambda child: child.total_action_value / (child.visits+1)).game.get_last_action()
+        action = max(node.children, key=mean_action_value).game.env.get_last_action()
 
         game.play(action)
+        return action
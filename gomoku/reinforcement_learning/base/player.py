@@ -7,13 +7,16 @@ from gomoku.reinforcement_learning.base.env_base import TwoPlayerEnv
 
 
 class IntuitivePlayer:
-    def __init__(self, policy_generator: Callable, value_estimator: Callable):
+    def __init__(self, policy_generator: Callable, value_estimator: Callable, children_value_estimator: Callable = None):
         """
         policy_generator: numpy [batch_size, state...] -> [batch_size, action_size]
         value_estimator: numpy [batch_size, state...] -> [batch_size, 1]
+        children_value_estimator (optional): (state, actions) -> the values of the states after each action, the same as
+            `value_estimator` on these states. For estimators that can reuse the work on the parent state.
         """
         self.policy_generator = policy_generator
         self.value_estimator = value_estimator
+        self.children_value_estimator = children_value_estimator
 
     def play(self, env: TwoPlayerEnv):
         policy = self.policy_generator(env)
@@ -0,0 +1,146 @@
+from typing import List
+from collections import deque
+import json
+import time
+
+import numpy as np
+
+
+class SearchTracer:
+    """
+    Record per-move search statistics and timed spans into ring buffers.
+
+    Pass an instance as `tracer` to `alphazero_play_one_game`. With `enabled=False` (or without a tracer) each simulation only
+    pays one attribute check, so the tracer can stay in production workers and be switched on when needed.
+
+    * moves:  the last `max_moves` per-move records (root children visits / Q / priors, tree depth distribution, nodes created,
+              time per phase)
+    * spans:  the last `max_spans` timed spans (name, start, duration, thread) in seconds of `time.perf_counter`. Spans of single
+              simulations are only kept with `record_simulations=True`, since there are thousands of them per move.
+    """
+    def __init__(self, max_moves: int = 256, max_spans: int = 100000, record_simulations: bool = False, enabled: bool = True):
+        self.enabled = enabled
+        self.record_simulations = record_simulations
+        self.moves = deque(maxlen=max_moves)
+        self.spans = deque(maxlen=max_spans)
+        self.move_index = 0
+        self._reset_move()
+
+    def _reset_move(self):
+        self.move_start = time.perf_counter()
+        self.phase_seconds = {"select": 0.0, "expand": 0.0, "simulate": 0.0}
+        self.n_simulations = 0
+        self.nodes_created = 0
+
+    def begin_game(self):
+        if not self.enabled:
+            return
+        self.move_index = 0
+        self._reset_move()
+
+    def record_simulation(self, start: float, select_seconds: float, expand_seconds: float, simulate_seconds: float,
+                          nodes_created: int):
+        """
+        Record one simulation started at `start`, with the same phase times as `metrics`. The spans of the phases are laid out
+        one after another from `start` (in lockstep self-play, the time the game waits for the others is in no phase).
+        """
+        if not self.enabled:
+            return
+        self.phase_seconds["select"] += select_seconds
+        self.phase_seconds["expand"] += expand_seconds
+        self.phase_seconds["simulate"] += simulate_seconds
+        self.n_simulations += 1
+        self.nodes_created += nodes_created
+        if self.record_simulations:
+            self.spans.append(("select", start, select_seconds, 1))
+            self.spans.append(("expand", start + select_seconds, expand_seconds, 1))
+            self.spans.append(("simulate", start + select_seconds + expand_seconds, simulate_seconds, 1))
+
+    def record_move(self, root, selected_child):
+        """
+        Record the statistics of the search at `root`. Must be called before the children of the root are cleared.
+        """
+        if not self.enabled:
+            return
+        move_end = time.perf_counter()
+        children = root.children
+        visits = np.array([child.visits for child in children], dtype=np.int64)
+        total_values = np.array([child.total_action_value for child in children], dtype=np.float64)
+
+        # Depth distribution of the nodes in the search tree (the root is at depth 0)
+        depths = []
+        frontier = [root]
+        while frontier:
+            depths.append(len(frontier))
+            frontier = [child for node in frontier for child in node.children]
+
+        self.moves.append({
+            "move": self.move_index,
+            "action": int(selected_child.game.env.get_last_action()),
+            "start": self.move_start,
+            "seconds": move_end - self.move_start,
+            "simulations": self.n_simulations,
+            "nodes_created": self.nodes_created,
+            "phase_seconds": dict(self.phase_seconds),
+            "depth_counts": depths,
+            "actions": np.array([child.game.env.get_last_action() for child in children], dtype=np.int64),
+            "visits": visits,
+            "q": np.where(visits > 0, -total_values / np.maximum(visits, 1), 0.0),  # From the view of the player choosing at the root
+            "priors": np.array([child.prior_mean_value for child in children], dtype=np.float64),
+        })
+        self.spans.append((f"move {self.move_index}", self.move_start, move_end - self.move_start, 0))
+        self.move_index += 1
+        self._reset_move()
+
+    def summary(self, top_k: int = 3) -> List[dict]:
+        """
+        Compact per-move summary: timings, tree shape and the `top_k` most visited root children.
+        """
+        rows = []
+        for move in self.moves:
+            order = np.argsort(-move["visits"])[:top_k]
+            depth_counts = np.array(move["depth_counts"])
+            rows.append({
+                "move": move["move"],
+                "action": move["action"],
+                "seconds": round(move["seconds"], 6),
+                "simulations": move["simulations"],
+                "nodes_created": move["nodes_created"],
+                "phase_seconds": {name: round(seconds, 6) for name, seconds in move["phase_seconds"].items()},
+                "max_depth": len(depth_counts) - 1,
+                "mean_depth": float(np.dot(np.arange(len(depth_counts)), depth_counts) / depth_counts.sum()),
+                "top_children": [
+                    {"action": int(move["actions"][i]), "visits": int(move["visits"][i]),
+                     "q": round(float(move["q"][i]), 4), "prior": round(float(move["priors"][i]), 4)}
+                    for i in order
+                ],
+            })
+        return rows
+
+    def chrome_trace(self) -> dict:
+        """
+        The recorded spans as Chrome trace-event JSON (open with chrome://tracing or Perfetto).
+        Thread 0 holds the moves, thread 1 the single simulations. Per-move phase times are emitted as counter events.
+        """
+        events = [
+            {"name": name, "ph": "X", "ts": start * 1e6, "dur": duration * 1e6, "pid": 0, "tid": tid}
+            for name, start, duration, tid in self.spans
+        ]
+        for move in self.moves:
+            events.append({
+                "name": "phase_seconds", "ph": "C", "ts": move["start"] * 1e6, "pid": 0,
+                "args": move["phase_seconds"]
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def export_summary(self, path: str, top_k: int = 3):
+        """
+        Write the per-move summary as JSON lines.
+        """
+        with open(path, "w") as f:
+            for row in self.summary(top_k):
+                f.write(json.dumps(row) + "\n")
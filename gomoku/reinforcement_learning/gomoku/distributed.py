@@ -0,0 +1,413 @@
+"""
+Distributed self-play: a coordinator trains the model, workers (on any machine) play games with the latest weights.
+
+    python -m gomoku.reinforcement_learning.gomoku.distributed coordinator --port 5080 --board-size 15 ...
+    python -m gomoku.reinforcement_learning.gomoku.distributed worker --host <coordinator> --port 5080
+
+Every message is [4 bytes header size][JSON header][payload of header["payload_size"] bytes]:
+* worker -> coordinator {"type": "hello", "worker": id}                      <- {"type": "config", board_size, ...}
+* worker -> coordinator {"type": "get_model", "version": known version}      <- {"type": "model", "version"} + weights (npz),
+                                                                                or {"type": "unchanged", "version"}
+* worker -> coordinator {"type": "game", "version", "n_moves", "winner", "metrics"} + moves (int16) + policies (float16)
+                                                                             <- {"type": "ack"}
+* worker -> coordinator {"type": "heartbeat"} after every move of a game     (no reply)
+A malformed message is answered with {"type": "error", "message"} and the connection is closed.
+Workers can join and leave at any time. Workers silent for `worker_timeout` seconds are dropped, and so are the games played
+with weights older than `max_staleness` versions. A worker keeps a finished game it could not send and sends it after
+reconnecting.
+The weights are sent in the format of `export_npz`, so the workers can run the model with numpy only (--backend numpy).
+Every game carries the metrics snapshot of its worker, and `SelfPlayCoordinator.snapshot` merges them with its own.
+"""
+from typing import Optional, Tuple, TYPE_CHECKING
+import argparse
+import io
+import json
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from gomoku.game.board import GomoBoard
+from gomoku.game.archive import moves_to_board
+from gomoku.nn.numpy_model import export_npz
+from gomoku.reinforcement_learning.base.player import Game
+from gomoku.reinforcement_learning.base.metrics import metrics, merge_snapshots, SnapshotExporter
+from gomoku.reinforcement_learning.base.monte_carlo import alphazero_play_one_game
+from gomoku.reinforcement_learning.gomoku.gomoku_env import GomoEnv
+from gomoku.reinforcement_learning.gomoku.gomoku_player import get_gomoku_player
+
+if TYPE_CHECKING:
+    from gomoku.reinforcement_learning.gomoku.gomoku_train import GomokuTrainer
+
+
+MAX_HEADER_SIZE = 1 << 20
+MAX_PAYLOAD_SIZE = 1 << 30
+
+
+def send_message(connection: socket.socket, header: dict, payload: bytes = b""):
+    header = json.dumps({**header, "payload_size": len(payload)}).encode()
+    connection.sendall(struct.pack(">I", len(header)) + header + payload)
+
+
+def _recv_exactly(connection: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size > 0:
+        chunk = connection.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_message(connection: socket.socket) -> Tuple[dict, bytes]:
+    """
+    Raise ValueError if the message is malformed (the connection can't be used afterwards).
+    """
+    header_size, = struct.unpack(">I", _recv_exactly(connection, 4))
+    if header_size > MAX_HEADER_SIZE:
+        raise ValueError(f"Header too large: {header_size} bytes")
+    header = json.loads(_recv_exactly(connection, header_size))
+    if not isinstance(header, dict):
+        raise ValueError("The header is not a JSON object")
+    payload_size = header.get("payload_size")
+    if not isinstance(payload_size, int) or not 0 <= payload_size <= MAX_PAYLOAD_SIZE:
+        raise ValueError(f"Invalid payload size: {payload_size!r}")
+    return header, _recv_exactly(connection, payload_size)
+
+
+def encode_game(moves: np.ndarray, policies: np.ndarray) -> bytes:
+    return np.asarray(moves, dtype=np.int16).tobytes() + np.asarray(policies, dtype=np.float16).tobytes()
+
+
+def decode_game(payload: bytes, n_moves: int, n_actions: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Raise ValueError if the payload is not a game of n_moves moves on a board of n_actions points.
+    """
+    if not isinstance(n_moves, int) or not 0 < n_moves <= n_actions:
+        raise ValueError(f"Invalid number of moves: {n_moves!r}")
+    if len(payload) != n_moves * 2 * (1 + n_actions):
+        raise ValueError(f"Payload of {len(payload)} bytes for {n_moves} moves on {n_actions} points")
+    moves = np.frombuffer(payload, dtype=np.int16, count=n_moves)
+    policies = np.frombuffer(payload, dtype=np.float16, offset=n_moves * 2).reshape(n_moves, n_actions)
+    if moves.min() < 0 or moves.max() >= n_actions or len(np.unique(moves)) != n_moves:
+        raise ValueError("Invalid moves")
+    return moves, policies.astype(np.float32)
+
+
+def game_training_data(moves: np.ndarray, policies: np.ndarray, winner: int, board_size: int):
+    """
+    Rebuild the training data of `alphazero_play_one_game` from a game record: the states are in the view of the player who
+    moved last (the first player is 1), and so are the values.
+    """
+    states, values = [], []
+    for i in range(len(moves)):
+        last_player = -1 if i % 2 == 0 else 1
+        states.append(moves_to_board(moves[:i], board_size) * last_player)
+        values.append(winner * last_player)
+    return np.array(states), policies, np.array(values)
+
+
+def model_to_bytes(model) -> bytes:
+    buffer = io.BytesIO()
+    export_npz(model, buffer)
+    return buffer.getvalue()
+
+
+class SelfPlayCoordinator:
+    """
+    Serve the weights of the trainer's model to the workers, collect their games and train on them.
+    worker_timeout: seconds without any message after which a worker is dropped. Workers send a heartbeat after every move,
+        so this must be longer than one move.
+    """
+    def __init__(self, trainer: "GomokuTrainer", host: str = "0.0.0.0", port: int = 5080, max_staleness: int = 2,
+                 metrics_path: Optional[str] = None, metrics_interval: float = 60.0, worker_timeout: float = 600.0):
+        self.trainer = trainer
+        self.max_staleness = max_staleness
+        self.worker_timeout = worker_timeout
+        self.worker_metrics = dict()  # worker id -> latest metrics snapshot (kept after the worker leaves)
+        self.metrics_exporter = SnapshotExporter(self, metrics_path, metrics_interval) if metrics_path is not None else None
+
+        self.lock = threading.Lock()
+        self.version = 0
+        self.weights = model_to_bytes(trainer.model)
+        self.games = queue.Queue()  # (version, moves, policies, winner)
+        self.workers = dict()  # worker id -> time of the last message
+
+        coordinator = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                coordinator.handle_connection(self.request)
+
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler, bind_and_activate=False)
+        self.server.daemon_threads = True
+        self.server.allow_reuse_address = True
+        self.server.server_bind()
+        self.server.server_activate()
+        self.address = self.server.server_address
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def handle_connection(self, connection: socket.socket):
+        worker = None
+        n_actions = self.trainer.board_size * self.trainer.board_size
+        # A worker which disappears without closing the connection (crash, network loss) must not hold a thread forever
+        connection.settimeout(self.worker_timeout)
+        connection.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        try:
+            while True:
+                header, payload = recv_message(connection)
+                if header["type"] == "hello":
+                    worker = str(header["worker"])
+                    send_message(connection, {
+                        "type": "config", "board_size": self.trainer.board_size,
+                        "simulations_per_step": self.trainer.simulations_per_step, "c_puct": self.trainer.c_puct
+                    })
+                elif header["type"] == "get_model":
+                    with self.lock:
+                        version, weights = self.version, self.weights
+                    if header["version"] == version:
+                        send_message(connection, {"type": "unchanged", "version": version})
+                    else:
+                        send_message(connection, {"type": "model", "version": version}, weights)
+                elif header["type"] == "game":
+                    moves, policies = decode_game(payload, header["n_moves"], n_actions)
+                    if header["winner"] not in (-1, 0, 1) or not isinstance(header["version"], int):
+                        raise ValueError(f"Invalid game: winner {header['winner']!r}, version {header['version']!r}")
+                    self.games.put((header["version"], moves, policies, header["winner"]))
+                    if worker is not None and "metrics" in header:
+                        self.worker_metrics[worker] = header["metrics"]
+                    metrics.count("remote_games")
+                    send_message(connection, {"type": "ack"})
+                elif header["type"] == "heartbeat":
+                    pass  # Only keeps the worker alive
+                else:
+                    raise ValueError(f"Unknown message type: {header['type']!r}")
+                if worker is not None:
+                    with self.lock:
+                        self.workers[worker] = time.time()
+        except (ValueError, KeyError, TypeError) as e:
+            metrics.count("bad_messages")
+            try:
+                send_message(connection, {"type": "error", "message": f"{type(e).__name__}: {e}"})
+            except OSError:
+                pass
+        except (ConnectionError, OSError):
+            pass  # The worker left or timed out; its finished games are already queued
+        finally:
+            if worker is not None:
+                with self.lock:
+                    self.workers.pop(worker, None)
+
+    def evict_workers(self) -> int:
+        """
+        Forget the workers silent for more than `worker_timeout` seconds. Return the number of remaining workers.
+        """
+        deadline = time.time() - self.worker_timeout
+        with self.lock:
+            for worker, last_seen in list(self.workers.items()):
+                if last_seen < deadline:
+                    del self.workers[worker]
+            return len(self.workers)
+
+    def snapshot(self) -> dict:
+        """
+        The metrics of the coordinator merged with the latest snapshots of all the workers.
+        """
+        return merge_snapshots([metrics.snapshot()] + list(self.worker_metrics.values()))
+
+    def publish_model(self):
+        weights = model_to_bytes(self.trainer.model)
+        with self.lock:
+            self.version += 1
+            self.weights = weights
+
+    def collect_games(self, n: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Wait for n fresh games and return their training data, like `GomokuTrainer.play_n_games`.
+        """
+        data = []
+        while len(data) < n:
+            version, moves, policies, winner = self.games.get()
+            if version < self.version - self.max_staleness:
+                metrics.count("stale_games")
+                continue
+            data.append(game_training_data(moves, policies, winner, self.trainer.board_size))
+            if self.trainer.archive_writer is not None:
+                self.trainer.archive_writer.add_game(moves, winner)
+        if self.trainer.archive_writer is not None:
+            self.trainer.archive_writer.flush()
+        return tuple(np.concatenate([d[i] for d in data]) for i in range(3))
+
+    def train(self, n_games_per_batch: int, n_batches: int, save_path: Optional[str] = None):
+        losses = []
+        for i in range(n_batches):
+            losses.append(self.trainer.train_one_batch(*self.collect_games(n_games_per_batch)))
+            self.publish_model()
+            if save_path is not None:
+                self.trainer.save(save_path)
+            if self.metrics_exporter is not None:
+                self.metrics_exporter.maybe_export()
+            n_workers = self.evict_workers()
+            if self.trainer.verbose:
+                print(f"Batch {i + 1}/{n_batches}: loss {losses[-1]:.4f}, model version {self.version}, {n_workers} workers")
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.maybe_export(force=True)
+        return losses
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SelfPlayWorker:
+    """
+    Play games with the latest weights of the coordinator and send them back. Reconnects if the coordinator is unreachable.
+    backend: "torch" (on `device`) or "numpy" (no PyTorch needed).
+    """
+    def __init__(self, host: str, port: int, device: str = "cpu", reconnect_interval: float = 1.0, backend: str = "torch"):
+        self.host = host
+        self.port = port
+        self.device = device
+        self.backend = backend
+        self.reconnect_interval = reconnect_interval
+        self.worker_id = uuid.uuid4().hex
+
+        self.player = None
+        self.config = None
+        self.version = -1
+
+    @staticmethod
+    def _request(connection: socket.socket, header: dict, payload: bytes = b"") -> Tuple[dict, bytes]:
+        """
+        Raise ValueError if the coordinator rejects the message.
+        """
+        send_message(connection, header, payload)
+        reply, reply_payload = recv_message(connection)
+        if reply["type"] == "error":
+            raise ValueError(f"Rejected by the coordinator: {reply['message']}")
+        return reply, reply_payload
+
+    def _setup(self, connection: socket.socket):
+        config, _ = self._request(connection, {"type": "hello", "worker": self.worker_id})
+        if self.config is None or config["board_size"] != self.config["board_size"]:
+            self.player = None
+            if self.backend == "torch":
+                self.player = get_gomoku_player(config["board_size"])
+                self.player.model.to(self.device)
+            self.version = -1
+        self.config = config
+
+    def _sync_model(self, connection: socket.socket):
+        header, payload = self._request(connection, {"type": "get_model", "version": self.version})
+        if header["type"] == "model":
+            if self.backend == "numpy":
+                self.player = get_gomoku_player(self.config["board_size"], "numpy", io.BytesIO(payload))
+            else:
+                import torch
+                weights = np.load(io.BytesIO(payload))
+                self.player.model.load_state_dict({name: torch.from_numpy(weights[name]) for name in self.player.model.state_dict()})
+            self.version = header["version"]
+
+    def play_game(self, connection: Optional[socket.socket] = None) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        Play one game, with a heartbeat to the coordinator on `connection` after every move.
+        """
+        def heartbeat(env: GomoEnv):
+            try:
+                send_message(connection, {"type": "heartbeat"})
+            except OSError:
+                pass  # The game is finished anyway, and sent after reconnecting
+
+        board_size = self.config["board_size"]
+        game = Game(self.player, self.player, GomoEnv(GomoBoard(board_size)))
+        game_data, step_nodes = alphazero_play_one_game(
+            game, self.config["simulations_per_step"], self.config["c_puct"], verbose=False,
+            callback_per_step=heartbeat if connection is not None else None
+        )
+        moves = np.array([node.game.env.get_last_action() for node in step_nodes[1:]])
+        policies = np.array([data[1] for data in game_data]).reshape(len(moves), board_size * board_size)
+        return moves, policies, step_nodes[-1].game.env.winner() or 0
+
+    def run(self, n_games: Optional[int] = None):
+        """
+        Play n_games games (forever if None).
+        """
+        n_played = 0
+        unsent = None  # (board size, header, payload) of a finished game which could not be sent yet
+        while n_games is None or n_played < n_games:
+            try:
+                with socket.create_connection((self.host, self.port)) as connection:
+                    self._setup(connection)
+                    while n_games is None or n_played < n_games:
+                        if unsent is None:
+                            self._sync_model(connection)
+                            version = self.version
+                            moves, policies, winner = self.play_game(connection)
+                            unsent = (self.config["board_size"], {
+                                "type": "game", "version": version, "n_moves": len(moves), "winner": int(winner)
+                            }, encode_game(moves, policies))
+                        board_size, header, payload = unsent
+                        if board_size == self.config["board_size"]:
+                            self._request(connection, {**header, "metrics": metrics.snapshot()}, payload)
+                            n_played += 1
+                        unsent = None
+            except ValueError:
+                unsent = None  # Rejected by the coordinator: sending it again would not help
+                time.sleep(self.reconnect_interval)
+            except (ConnectionError, OSError):
+                time.sleep(self.reconnect_interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Distributed self-play.")
+    subparsers = parser.add_subparsers(dest="role", required=True)
+
+    coordinator_parser = subparsers.add_parser("coordinator")
+    coordinator_parser.add_argument("--host", default="0.0.0.0")
+    coordinator_parser.add_argument("--port", type=int, default=5080)
+    coordinator_parser.add_argument("--board-size", type=int, default=15)
+    coordinator_parser.add_argument("--simulations-per-step", type=int, default=1000)
+    coordinator_parser.add_argument("--c-puct", type=float, default=5.0)
+    coordinator_parser.add_argument("--device", default="cpu")
+    coordinator_parser.add_argument("--n-games-per-batch", type=int, default=32)
+    coordinator_parser.add_argument("--n-batches", type=int, default=100)
+    coordinator_parser.add_argument("--max-staleness", type=int, default=2)
+    coordinator_parser.add_argument("--worker-timeout", type=float, default=600.0, help="Drop the workers silent for this many seconds")
+    coordinator_parser.add_argument("--save-path")
+    coordinator_parser.add_argument("--archive-path")
+    coordinator_parser.add_argument("--metrics-path", help="Export the metrics of all the workers to this .json or .csv file")
+    coordinator_parser.add_argument("--metrics-interval", type=float, default=60.0)
+
+    worker_parser = subparsers.add_parser("worker")
+    worker_parser.add_argument("--host", default="127.0.0.1")
+    worker_parser.add_argument("--port", type=int, default=5080)
+    worker_parser.add_argument("--device", default="cpu")
+    worker_parser.add_argument("--backend", choices=["torch", "numpy"], default="torch")
+    worker_parser.add_argument("--n-games", type=int)
+
+    args = parser.parse_args(argv)
+    if args.role == "coordinator":
+        from gomoku.reinforcement_learning.gomoku.gomoku_train import GomokuTrainer
+
+        trainer = GomokuTrainer(args.board_size, args.simulations_per_step, args.c_puct, args.device, archive_path=args.archive_path)
+        coordinator = SelfPlayCoordinator(
+            trainer, args.host, args.port, args.max_staleness, args.metrics_path, args.metrics_interval, args.worker_timeout
+        )
+        print(f"Coordinator listening on {coordinator.address[0]}:{coordinator.address[1]}")
+        try:
+            coordinator.train(args.n_games_per_batch, args.n_batches, args.save_path)
+        finally:
+            coordinator.close()
+    else:
+        SelfPlayWorker(args.host, args.port, args.device, backend=args.backend).run(args.n_games)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+from typing import List, Optional
+from collections import deque
+import json
+import socket
+import threading
+import time
+
+from gomoku.reinforcement_learning.gomoku.gomoku_env import GomoEnv
+
+
+class GameEventPublisher:
+    """
+    Publish the moves of the self-play games to observers over a local TCP socket.
+
+    Use `callback_per_game` / `callback_per_step` as the callbacks of `GomokuTrainer`. The callbacks only record the moves and,
+    at most once every `interval` seconds, hand the latest snapshot to a background thread which sends it to the connected
+    observers. Only the latest snapshot is kept, so a slow (or absent) observer never slows down the training. The final
+    snapshot of every game (with the winning move) is always published and queued, so it is not replaced by the next game.
+
+    Every message is one JSON line: {"game": game index, "board_size": ..., "moves": [action, ...], "finished": bool}. Since a
+    snapshot holds all the moves of the current game, observers can connect at any time and dropped snapshots lose nothing.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 5070, interval: float = 0.2):
+        self.interval = interval
+
+        self.game_index = -1
+        self.board_size = None
+        self.moves: List[int] = []
+        self.n_published_moves = 0
+        self.last_publish = 0.0
+
+        self._latest: Optional[bytes] = None
+        self._finished = deque(maxlen=16)  # Final snapshots not sent yet
+        self._latest_version = 0
+        self._changed = threading.Condition()
+        self._closed = False
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen()
+        self.server.settimeout(interval)
+        self.address = self.server.getsockname()
+        self.clients: List[socket.socket] = []
+
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def callback_per_game(self, env: GomoEnv):
+        if len(self.moves) > self.n_published_moves:
+            self.publish(finished=True)  # The end of the previous game, if it was not published yet
+        self.game_index += 1
+        self.board_size = env.board.board_size
+        self.moves = [env.board.board_size * x + y for _, (x, y), _ in env.board.history[1:]]
+        self.publish()
+
+    def callback_per_step(self, env: GomoEnv):
+        self.moves.append(int(env.get_last_action()))
+        if env.is_end():
+            self.publish(finished=True)
+        elif time.time() - self.last_publish >= self.interval:
+            self.publish()
+
+    def publish(self, finished: bool = False):
+        self.last_publish = time.time()
+        self.n_published_moves = len(self.moves)
+        message = json.dumps({
+            "game": self.game_index, "board_size": self.board_size, "moves": self.moves, "finished": finished
+        }).encode() + b"\n"
+        with self._changed:
+            if finished:
+                self._finished.append(message)
+            self._latest = message
+            self._latest_version += 1
+            self._changed.notify()
+
+    def _serve(self):
+        sent_version = 0
+        while not self._closed:
+            try:
+                client, _ = self.server.accept()
+                client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.clients.append(client)
+                sent_version = 0  # Send the latest snapshot to the new observer as well
+            except socket.timeout:
+                pass
+            except OSError:
+                break
+
+            with self._changed:
+                if self._latest_version == sent_version:
+                    self._changed.wait(self.interval)
+                messages = list(self._finished)
+                self._finished.clear()
+                if self._latest is not None and self._latest_version != sent_version and self._latest not in messages:
+                    messages.append(self._latest)
+                sent_version = self._latest_version
+
+            for client in self.clients[:]:
+                try:
+                    for message in messages:
+                        client.sendall(message)
+                except OSError:
+                    client.close()
+                    self.clients.remove(client)
+
+    def close(self):
+        self._closed = True
+        with self._changed:
+            self._changed.notify()
+        self.server.close()
+        self._thread.join()
+        for client in self.clients:
+            client.close()
+
+
+class GameEventSubscriber:
+    """
+    Receive the snapshots of a `GameEventPublisher` in a background thread and keep the latest one, and the final snapshots of
+    the games in order. Reconnects every `retry_interval` seconds if the publisher is not (yet) available.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 5070, retry_interval: float = 1.0):
+        self.host = host
+        self.port = port
+        self.retry_interval = retry_interval
+
+        self._latest: Optional[dict] = None
+        self._finished = deque(maxlen=16)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._receive, daemon=True)
+        self._thread.start()
+
+    def latest(self) -> Optional[dict]:
+        """
+        Return the oldest final snapshot not returned yet, otherwise the latest snapshot not returned yet, or None.
+        """
+        with self._lock:
+            if self._finished:
+                return self._finished.popleft()
+            snapshot, self._latest = self._latest, None
+        return snapshot
+
+    def _receive(self):
+        while not self._closed:
+            try:
+                with socket.create_connection((self.host, self.port)) as connection:
+                    for line in connection.makefile("rb"):
+                        snapshot = json.loads(line)
+                        with self._lock:
+                            if snapshot.get("finished"):
+                                self._finished.append(snapshot)
+                                self._latest = None
+                            else:
+                                self._latest = snapshot
+                        if self._closed:
+                            return
+            except OSError:
+                pass
+            time.sleep(self.retry_interval)
+
+    def close(self):
+        self._closed = True
@@ -1,24 +1,38 @@
 import numpy as np
-import torch
 
-from gomoku.reinforcement_learning.base.player import IntuitivePlayer
-from gomoku.nn.gomoku_model import GomokuModel
+from gomoku.game.board import GomoBoard
+from gomoku.reinforcement_learning.base.player import IntuitivePlayer, Game
+from gomoku.reinforcement_learning.base.monte_carlo import MCTSPlayer, visit_distribution
+from gomoku.reinforcement_learning.gomoku.gomoku_env import GomoEnv
+from gomoku.nn.numpy_model import NumpyGomokuModel
 
 
-def get_gomoku_player(board_size: int) -> IntuitivePlayer:
+def get_gomoku_player(board_size: int, backend: str = "torch", weights_path = None) -> IntuitivePlayer:
     """
     Get a Gomoku player.
+    backend: "torch" (`GomokuModel`, trainable) or "numpy" (`NumpyGomokuModel`, inference only, without PyTorch).
+    weights_path: a state dict saved by `GomokuTrainer.save` for "torch" (optional), an .npz file of `export_npz` for "numpy".
     """
+    if backend == "numpy":
+        return get_numpy_gomoku_player(board_size, weights_path)
+    if backend != "torch":
+        raise ValueError(f"Unknown backend: {backend}")
+
+    import torch  # Only imported for this backend, so that the numpy workers don't load PyTorch
+    from gomoku.nn.gomoku_model import GomokuModel
+
     model = GomokuModel(board_size, board_size * board_size)
-    
+    if weights_path is not None:
+        model.load_state_dict(torch.load(weights_path, map_location="cpu"))
+
     def policy_generator(state: np.ndarray) -> np.ndarray:
         """
         Generate the policy for the given board.
         """
         device = next(model.parameters()).device
         state = torch.from_numpy(state)[None, None, :, :].float().to(device)
-        action_probs = torch.softmax(model(state)[0], dim=0) * (state == 0).float()  # (state == 0) 表示未落子位置
-        return action_probs.flatten().cpu().detach().numpy()
+        action_probs = torch.softmax(model(state)[0][0], dim=0) * (state.flatten() == 0).float()  # (state == 0) 表示未落子位置
+        return action_probs.cpu().detach().numpy()
 
     def value_estimator(state: np.ndarray) -> float:
         """
@@ -31,3 +45,67 @@ def get_gomoku_player(board_size: int) -> IntuitivePlayer:
     gomoku_player = IntuitivePlayer(policy_generator, value_estimator)
     gomoku_player.model = model
     return gomoku_player
+
+
+def get_numpy_gomoku_player(board_size: int, weights_path) -> IntuitivePlayer:
+    """
+    Get a Gomoku player whose model runs with numpy only. weights_path: an .npz file (or file object) of `export_npz`.
+    """
+    if weights_path is None:
+        raise ValueError("The numpy backend needs the weights exported by export_npz")
+    model = NumpyGomokuModel.load(weights_path)
+    if model.board_size != board_size:
+        raise ValueError(f"The weights are for board size {model.board_size}, not {board_size}")
+
+    def policy_generator(state: np.ndarray) -> np.ndarray:
+        """
+        Generate the policy for the given board.
+        """
+        logits = model(state[None, None])[0][0]
+        action_probs = np.exp(logits - logits.max())
+        return action_probs / action_probs.sum() * (state.flatten() == 0)  # (state == 0) 表示未落子位置
+
+    def value_estimator(state: np.ndarray) -> np.ndarray:
+        """
+        Estimate the value of the given boards.
+        """
+        return model(state[:, None])[1][:, 0]
+
+    gomoku_player = IntuitivePlayer(policy_generator, value_estimator)
+    gomoku_player.model = model
+    return gomoku_player
+
+
+def get_ai_play(player: IntuitivePlayer, n_simulations: int, c_puct: float = 5.0, n_progress_reports: int = 50, opening_book = None):
+    """
+    Get an `ai_play` function for `GomokuUI`, which searches with MCTS.
+    ai_play(board, progress) -> (x, y), or None if cancelled.
+    progress(fraction, visits) is called after every simulation and returns False to cancel the search. `visits` is the
+    visit distribution of the root ([board_size, board_size]), computed only `n_progress_reports` times per search (None otherwise).
+    With `opening_book`, the book moves are played without searching.
+    """
+    mcts_player = MCTSPlayer(player, c_puct, opening_book)
+
+    def ai_play(board: np.ndarray, progress=None):
+        board_size = board.shape[0]
+        gomo_board = GomoBoard(board_size)
+        last_player = -1 if np.sum(board == 1) == np.sum(board == -1) else 1  # 黑棋（1）先手
+        gomo_board.history = [(board.astype(np.int8), None, last_player)]
+        game = Game(player, player, GomoEnv(gomo_board))
+
+        callback_per_simulation = None
+        if progress is not None:
+            report_every = max(1, n_simulations // n_progress_reports)
+
+            def callback_per_simulation(root, n_finished: int) -> bool:
+                visits = None
+                if n_finished % report_every == 0 or n_finished == n_simulations:
+                    visits = visit_distribution(root, board_size * board_size).reshape(board_size, board_size)
+                return progress(n_finished / n_simulations, visits)
+
+        action = mcts_player.play(game, n_simulations, callback_per_simulation)
+        if action is None:
+            return None
+        return action // board_size, action % board_size
+
+    return ai_play
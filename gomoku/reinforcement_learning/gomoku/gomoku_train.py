@@ -1,31 +1,35 @@
-from typing import Callable
-
-import threading
-from tqdm import tqdm
-
+from typing import Callable, Tuple
 
 import numpy as np
 
 import torch
 import torch.nn.functional as F
 
-from PySide6.QtWidgets import QApplication
-
-from gomoku.winui.main_window import GomokuUI
 from gomoku.game.board import GomoBoard
+from gomoku.game.archive import GameArchiveWriter
 
-from gomoku.reinforcement_learning.base.player import Game
+from gomoku.reinforcement_learning.base.player import Game, IntuitivePlayer
 from gomoku.reinforcement_learning.gomoku.gomoku_env import GomoEnv
 from gomoku.reinforcement_learning.gomoku.gomoku_player import get_gomoku_player
 
-from gomoku.reinforcement_learning.base.monte_carlo import alphazero_play_one_game
+from gomoku.reinforcement_learning.base.monte_carlo import alphazero_play_one_game, MCTSNode
+from gomoku.reinforcement_learning.base.lockstep import lockstep_play_games
+from gomoku.reinforcement_learning.base.metrics import metrics, SnapshotExporter
+from gomoku.reinforcement_learning.base.trace import SearchTracer
+from gomoku.reinforcement_learning.gomoku.opening_book import OpeningBook
 
 
 class GomokuTrainer:
     def __init__(self, board_size: int, simulations_per_step: int, c_puct: float, device: str, 
                  verbose: bool = True, 
                  callback_per_game: Callable[[GomoEnv], None] = None,
-                 callback_per_step: Callable[[GomoEnv], None] = None):
+                 callback_per_step: Callable[[GomoEnv], None] = None,
+                 metrics_path: str = None, metrics_interval: float = 60.0,
+                 tracer: SearchTracer = None,
+                 archive_path: str = None,
+                 opening_book: OpeningBook = None,
+                 root_search: Callable[[MCTSNode, SearchTracer], Tuple[MCTSNode, np.ndarray]] = None,
+                 lockstep_games: int = 1):
         self.board_size = board_size
         self.simulations_per_step = simulations_per_step
         self.c_puct = c_puct
@@ -41,9 +45,30 @@ class GomokuTrainer:
 
         self.callback_per_game = callback_per_game
         self.callback_per_step = callback_per_step
+
+        # Metrics snapshots are exported to metrics_path (.json or .csv) at most once every metrics_interval seconds
+        self.metrics_exporter = SnapshotExporter(metrics, metrics_path, metrics_interval) if metrics_path is not None else None
+        self.tracer = tracer
+
+        # The self-play games are appended to the archive at archive_path, which can be browsed in the replay mode of GomokuUI
+        self.archive_writer = GameArchiveWriter(archive_path, board_size) if archive_path is not None else None
+        self.opening_book = opening_book
+        self.root_search = root_search  # None: PUCT with simulations_per_step. See GumbelRootSearch for low simulation budgets
+
+        # Play lockstep_games games at once, with their NN evaluations batched together (see lockstep_play_games).
+        # The UI callbacks and the tracer then only follow the first game of every group (the tracer is passed to it).
+        if lockstep_games > 1 and root_search is not None:
+            raise ValueError("Lockstep games only support the PUCT search")
+        self.lockstep_games = lockstep_games
     
 
 
+    def set_search_player(self, player: IntuitivePlayer = None):
+        """
+        Use `player` (e.g. the pattern evaluator) instead of the model as the prior of the self-play search. None: the model.
+        """
+        self.game = Game(player or self.player, player or self.player, self.env)
+
     def play_n_games(self, n: int):
         """
         Play n games.
@@ -54,14 +79,32 @@ class GomokuTrainer:
         if self.verbose:
             print(f"Playing {n} games...")
 
-        loop = tqdm(range(n)) if self.verbose else range(n)
-        for _ in loop:
-            initial_game = self.game.clone()
+        loop = range(0, n, self.lockstep_games)
+        if self.verbose:
+            from tqdm import tqdm  # Only for the progress bar, so that the headless workers don't need to import it
+            loop = tqdm(loop)
+        for start in loop:
+            initial_games = [self.game.clone() for _ in range(min(self.lockstep_games, n - start))]
 
             if self.callback_per_game is not None:
-                self.callback_per_game(initial_game.env)
+                self.callback_per_game(initial_games[0].env)
+
+            if len(initial_games) == 1:
+                results = [alphazero_play_one_game(initial_games[0], self.simulations_per_step, self.c_puct, self.verbose, self.callback_per_step, self.tracer, self.opening_book, self.root_search)]
+            else:
+                callbacks_per_step = [self.callback_per_step] + [None] * (len(initial_games) - 1)
+                results = lockstep_play_games(initial_games, self.simulations_per_step, self.c_puct, callbacks_per_step=callbacks_per_step, opening_book=self.opening_book, tracer=self.tracer)
 
-            data_list += alphazero_play_one_game(initial_game, self.simulations_per_step, self.c_puct, self.verbose, self.callback_per_step)[0]
+            for game_data, step_nodes in results:
+                data_list += game_data
+                if self.archive_writer is not None:
+                    self.archive_writer.add_game([node.game.env.get_last_action() for node in step_nodes[1:]], step_nodes[-1].game.env.winner())
+
+            if self.metrics_exporter is not None:
+                self.metrics_exporter.maybe_export()
+
+        if self.archive_writer is not None:
+            self.archive_writer.flush()
 
         if self.verbose:
             print(f"Finished playing {n} games.")
@@ -77,20 +120,24 @@ class GomokuTrainer:
         Train the model.
         """
 
-        states = torch.from_numpy(states).float()[:, None, :, :]
-        action_probs = torch.from_numpy(action_probs).float()  # [batch_size, action_size]
-        values = torch.from_numpy(values).float()[:, None]  # [batch_size, 1]
+        with metrics.timer("train_step"):
+            states = torch.from_numpy(states).float()[:, None, :, :]
+            action_probs = torch.from_numpy(action_probs).float()  # [batch_size, action_size]
+            values = torch.from_numpy(values).float()[:, None]  # [batch_size, 1]
+
+            self.optimizer.zero_grad()
+            pred_action_probs, pred_values = self.model(states)
 
-        self.optimizer.zero_grad()
-        pred_action_probs, pred_values = self.model(states)
+            loss_value = F.mse_loss(pred_values, values)
+            loss_policy = F.cross_entropy(pred_action_probs, action_probs)
 
-        loss_value = F.mse_loss(pred_values, values)
-        loss_policy = F.cross_entropy(pred_action_probs, action_probs)
+            loss = loss_value + loss_policy
+            loss.backward()
+            self.optimizer.step()
+            loss = loss.item()
 
-        loss = loss_value + loss_policy
-        loss.backward()
-        self.optimizer.step()
-        return loss.item()
+        metrics.count("train_samples", len(states))
+        return loss
 
     def self_play(self, n_games_per_batch: int, n_batches: int):
         """
@@ -101,6 +148,8 @@ class GomokuTrainer:
             train_batch = self.play_n_games(n_games_per_batch)
             losses.append(self.train_one_batch(*train_batch))
 
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.maybe_export(force=True)
         return losses
 
 
@@ -0,0 +1,157 @@
+"""
+Opening book built from self-play games.
+
+    python -m gomoku.reinforcement_learning.gomoku.opening_book --archive games/ --output book.npz --max-plies 12
+
+Positions are keyed by a hash of their canonical form under the 8 symmetries of the board, so the games of all the
+symmetric openings are aggregated together.
+"""
+from typing import List, Optional, Tuple
+import argparse
+import hashlib
+
+import numpy as np
+
+from gomoku.game.archive import GameArchive, moves_to_board
+from gomoku.reinforcement_learning.gomoku.gomoku_env import GomoEnv
+
+
+def symmetry_permutations(board_size: int) -> np.ndarray:
+    """
+    Return: [8, board_size * board_size]. perms[t][a] is the action of the original board which is at the action a of the
+    board transformed by the t-th symmetry, i.e. transformed.flatten() == board.flatten()[perms[t]].
+    """
+    index = np.arange(board_size * board_size).reshape(board_size, board_size)
+    perms = []
+    for flip in (False, True):
+        flipped = index.T if flip else index
+        for k in range(4):
+            perms.append(np.rot90(flipped, k).flatten())
+    return np.array(perms)
+
+
+def canonical_key(board: np.ndarray, perms: np.ndarray) -> Tuple[int, int]:
+    """
+    Return: (hash of the canonical form of the board, index of the symmetry which transforms the board to the canonical form)
+    """
+    flat = board.flatten()
+    transformed = [flat[perm].tobytes() for perm in perms]
+    t = min(range(len(transformed)), key=transformed.__getitem__)
+    digest = hashlib.blake2b(transformed[t], digest_size=8).digest()
+    return int(np.frombuffer(digest, dtype=np.int64)[0]), t
+
+
+class OpeningBook:
+    """
+    Move statistics of the early positions, stored as an indexed table:
+    * keys:       sorted canonical position hashes
+    * offsets:    the moves of the position keys[i] are entries offsets[i]:offsets[i+1]
+    * actions:    the moves in the canonical orientation
+    * counts:     how many times each move was played
+    * value_sums: the sum of the game results of each move from the view of the player of the move
+
+    `probe` returns a policy only for positions seen at least `min_visits` times, and `choose` samples from it with
+    `temperature` (0 means always the most played move).
+    """
+    def __init__(self, board_size: int, keys: np.ndarray, offsets: np.ndarray, actions: np.ndarray, counts: np.ndarray,
+                 value_sums: np.ndarray, min_visits: int = 10, temperature: float = 0.0, seed: Optional[int] = None):
+        self.board_size = board_size
+        self.keys = keys
+        self.offsets = offsets
+        self.actions = actions
+        self.counts = counts
+        self.value_sums = value_sums
+        self.min_visits = min_visits
+        self.temperature = temperature
+        self.rng = np.random.default_rng(seed)
+        self.perms = symmetry_permutations(board_size)
+
+    @classmethod
+    def build(cls, archives: List[GameArchive], max_plies: int = 12, **kwargs) -> "OpeningBook":
+        """
+        Aggregate the first `max_plies` moves of all the games in the archives.
+        """
+        board_size = archives[0].board_size
+        perms = symmetry_permutations(board_size)
+        inverse_perms = np.argsort(perms, axis=1)  # Map the actions of the original board to the transformed board
+        stats = dict()  # (key, canonical action) -> [count, value_sum]
+        for archive in archives:
+            if archive.board_size != board_size:
+                raise ValueError("All the archives must have the same board size")
+            for i in range(len(archive)):
+                moves = np.array(archive.game_moves(i))
+                winner = archive.winner(i)
+                for ply in range(min(max_plies, len(moves))):
+                    key, t = canonical_key(moves_to_board(moves[:ply], board_size), perms)
+                    player = 1 if ply % 2 == 0 else -1
+                    stat = stats.setdefault((key, int(inverse_perms[t][moves[ply]])), [0, 0.0])
+                    stat[0] += 1
+                    stat[1] += winner * player
+
+        entries = sorted(stats.items())
+        keys, first_entries = np.unique(np.array([key for (key, _), _ in entries], dtype=np.int64), return_index=True)
+        return cls(
+            board_size,
+            keys=keys,
+            offsets=np.append(first_entries, len(entries)).astype(np.int64),
+            actions=np.array([action for (_, action), _ in entries], dtype=np.int16),
+            counts=np.array([count for _, (count, _) in entries], dtype=np.int32),
+            value_sums=np.array([value_sum for _, (_, value_sum) in entries], dtype=np.float32),
+            **kwargs
+        )
+
+    def save(self, path: str):
+        np.savez(path, board_size=self.board_size, keys=self.keys, offsets=self.offsets, actions=self.actions,
+                 counts=self.counts, value_sums=self.value_sums)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "OpeningBook":
+        data = np.load(path)
+        return cls(int(data["board_size"]), data["keys"], data["offsets"], data["actions"], data["counts"],
+                   data["value_sums"], **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def probe_board(self, board: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Return: the policy (play frequencies) over the actions of the board, or None if the position is not in the book.
+        """
+        if board.shape[0] != self.board_size:
+            return None
+        key, t = canonical_key(board, self.perms)
+        i = np.searchsorted(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        counts = self.counts[start:end]
+        if counts.sum() < self.min_visits:
+            return None
+        policy = np.zeros(self.board_size * self.board_size, dtype=np.float32)
+        policy[self.perms[t][self.actions[start:end]]] = counts / counts.sum()
+        return policy
+
+    def probe(self, env: GomoEnv) -> Optional[np.ndarray]:
+        return self.probe_board(env.board.get_board())
+
+    def choose(self, policy: np.ndarray) -> int:
+        if self.temperature == 0:
+            return int(np.argmax(policy))
+        weights = policy ** (1 / self.temperature)
+        return int(self.rng.choice(len(policy), p=weights / weights.sum()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build an opening book from self-play archives.")
+    parser.add_argument("--archive", action="append", required=True, help="Archive directory (can be repeated)")
+    parser.add_argument("--output", required=True, help="Output .npz file")
+    parser.add_argument("--max-plies", type=int, default=12)
+    args = parser.parse_args(argv)
+
+    book = OpeningBook.build([GameArchive(path) for path in args.archive], args.max_plies)
+    book.save(args.output)
+    print(f"Saved {len(book)} positions to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+Heuristic evaluator based on precomputed line-pattern tables.
+
+For every empty point and every direction, the 8 neighbouring cells on the line (4 on each side) are encoded as a base-3
+number (0: empty, 1: own stone, 2: opponent stone or outside of the board). A table maps this code to the pattern that
+playing at the point creates on that line (five, open four, four, open three, ...). The codes of a whole batch of boards
+are computed with numpy. The children of a search node are evaluated incrementally from the codes of the node
+(`evaluate_children`), and `PatternBoard` updates its codes as stones are placed.
+"""
+from typing import Tuple
+from functools import lru_cache
+
+import numpy as np
+
+from gomoku.reinforcement_learning.base.player import IntuitivePlayer
+
+
+# Patterns, ordered by strength
+NONE, TWO, OPEN_TWO, THREE, OPEN_THREE, FOUR, OPEN_FOUR, FIVE = range(8)
+PATTERN_SCORES = np.array([0, 10, 50, 60, 500, 600, 10000, 100000], dtype=np.float64)
+DOUBLE_THREAT_SCORE = 8000  # Two fours, or a four and an open three (in different directions): usually wins
+DOUBLE_OPEN_THREE_SCORE = 5000
+
+DIRECTIONS = [(1, 0), (0, 1), (1, 1), (1, -1)]
+OFFSETS = [-4, -3, -2, -1, 1, 2, 3, 4]  # The cells of a line code, the point itself excluded
+POWERS = 3 ** np.arange(8)
+
+EMPTY, OWN, BLOCKED = 0, 1, 2
+
+
+def _completions(line: list) -> set:
+    """
+    The empty cells which make a five through the center (index 4) of the line, where the center is an own stone.
+    """
+    cells = set()
+    for start in range(5):
+        window = line[start:start + 5]
+        if BLOCKED not in window and window.count(OWN) == 4:
+            cells.add(start + window.index(EMPTY))
+    return cells
+
+
+def _classify(line: list, depth: int = 0) -> int:
+    """
+    The pattern created through the center of the line (with an own stone at the center).
+    """
+    for start in range(5):
+        if line[start:start + 5] == [OWN] * 5:
+            return FIVE
+    n_completions = len(_completions(line))
+    if n_completions >= 2:
+        return OPEN_FOUR
+    if n_completions == 1:
+        return FOUR
+    if depth == 2:
+        return NONE
+
+    # A three (two) is a line which becomes a four (three) with one more own stone
+    best = NONE
+    for i in range(9):
+        if line[i] == EMPTY:
+            pattern = _classify(line[:i] + [OWN] + line[i + 1:], depth + 1)
+            best = max(best, {OPEN_FOUR: OPEN_THREE, FOUR: THREE, OPEN_THREE: OPEN_TWO, THREE: TWO}.get(pattern, NONE))
+    return best
+
+
+@lru_cache(maxsize=None)
+def pattern_table() -> np.ndarray:
+    """
+    Return: [3 ** 8] int8, the pattern created by playing at a point, indexed by the line code of the point.
+    """
+    table = np.zeros(3 ** 8, dtype=np.int8)
+    for code in range(3 ** 8):
+        cells = [code // 3 ** i % 3 for i in range(8)]
+        table[code] = _classify(cells[:4] + [OWN] + cells[4:])
+    return table
+
+
+def line_codes(states: np.ndarray, player: int) -> np.ndarray:
+    """
+    Return: [batch_size, 4, board_size, board_size], the line codes of all the points for `player` (1 or -1).
+    """
+    batch_size, board_size, _ = states.shape
+    cells = np.full((batch_size, board_size + 8, board_size + 8), BLOCKED, dtype=np.int64)
+    inner = cells[:, 4:-4, 4:-4]
+    inner[states == 0] = EMPTY
+    inner[states == player] = OWN
+    inner[states == -player] = BLOCKED
+
+    codes = np.zeros((batch_size, 4, board_size, board_size), dtype=np.int64)
+    for d, (dx, dy) in enumerate(DIRECTIONS):
+        for power, k in zip(POWERS, OFFSETS):
+            codes[:, d] += power * cells[:, 4 + k * dx:4 + k * dx + board_size, 4 + k * dy:4 + k * dy + board_size]
+    return codes
+
+
+def scores_from_patterns(patterns: np.ndarray) -> np.ndarray:
+    """
+    patterns: [..., 4, board_size, board_size] -> scores: [..., board_size, board_size]
+    """
+    scores = PATTERN_SCORES[patterns].sum(axis=-3)
+    n_fours = ((patterns == FOUR) | (patterns == OPEN_FOUR)).sum(axis=-3)
+    n_open_threes = (patterns == OPEN_THREE).sum(axis=-3)
+    scores = np.where((n_fours >= 2) | ((n_fours >= 1) & (n_open_threes >= 1)), np.maximum(scores, DOUBLE_THREAT_SCORE), scores)
+    scores = np.where(n_open_threes >= 2, np.maximum(scores, DOUBLE_OPEN_THREE_SCORE), scores)
+    return scores
+
+
+def move_scores(states: np.ndarray, player: int) -> np.ndarray:
+    """
+    Return: [batch_size, board_size, board_size], the score of playing at each point for `player` (0 for occupied points).
+    """
+    patterns = pattern_table()[line_codes(states, player)]
+    return scores_from_patterns(patterns) * (states == 0)
+
+
+@lru_cache(maxsize=None)
+def update_indices(board_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The line codes changed by placing a stone, for every action: their flat indices in [4, board_size, board_size] (the points
+    outside of the board point to the dummy index 4 * board_size * board_size) and the power of the stone in them.
+    Return: indices [n_actions, 32], powers [n_actions, 32]
+    """
+    n = board_size
+    indices = np.full((n * n, 32), 4 * n * n, dtype=np.int64)
+    powers = np.zeros((n * n, 32), dtype=np.int64)
+    for action in range(n * n):
+        x, y = divmod(action, n)
+        for d, (dx, dy) in enumerate(DIRECTIONS):
+            for j, (power, k) in enumerate(zip(POWERS, OFFSETS)):
+                # Same as `PatternBoard._update`: (x, y) is at the offset k of the line of (qx, qy)
+                qx, qy = x - k * dx, y - k * dy
+                if 0 <= qx < n and 0 <= qy < n:
+                    indices[action, d * 8 + j] = d * n * n + qx * n + qy
+                    powers[action, d * 8 + j] = power
+    return indices, powers
+
+
+def has_five(states: np.ndarray, player: int) -> np.ndarray:
+    """
+    Return: [batch_size] bool, whether `player` has five in a row.
+    """
+    stones = (states == player).astype(np.int8)
+    board_size = states.shape[1]
+    padded = np.zeros((len(states), board_size + 8, board_size + 8), dtype=np.int8)
+    padded[:, 4:-4, 4:-4] = stones
+    result = np.zeros(len(states), dtype=bool)
+    for dx, dy in DIRECTIONS:
+        count = np.zeros_like(stones)
+        for k in range(5):
+            count += padded[:, 4 + k * dx:4 + k * dx + board_size, 4 + k * dy:4 + k * dy + board_size]
+        result |= (count == 5).any(axis=(1, 2))
+    return result
+
+
+def _evaluate(last_scores: np.ndarray, next_scores: np.ndarray, last_has_five: np.ndarray, scale: float) -> np.ndarray:
+    """
+    last_scores, next_scores: [batch_size, n_points], the move scores of the player who moved last and of the player to move
+    """
+    next_best = next_scores.max(axis=1)
+    n_last_fives = (last_scores >= PATTERN_SCORES[FIVE]).sum(axis=1)
+
+    # The player to move has the tempo, so its threats count more
+    values = np.tanh((last_scores.max(axis=1) - 2 * next_best) / scale)
+    values = np.where((n_last_fives >= 2) & (next_best < PATTERN_SCORES[FIVE]), 0.9, values)
+    values = np.where(next_best >= PATTERN_SCORES[FIVE], -1.0, values)
+    values = np.where(last_has_five, 1.0, values)
+    return values.astype(np.float32)
+
+
+def evaluate_states(states: np.ndarray, scale: float = 1000.0) -> np.ndarray:
+    """
+    Value of the states in the convention of `value_estimator`: the stones of the player who moved last are 1, the stones of
+    the player to move are -1, and the value is from the view of the player who moved last.
+    """
+    last_scores = move_scores(states, 1).reshape(len(states), -1)
+    next_scores = move_scores(states, -1).reshape(len(states), -1)
+    return _evaluate(last_scores, next_scores, has_five(states, 1), scale)
+
+
+def evaluate_children(state: np.ndarray, actions: np.ndarray, scale: float = 1000.0) -> np.ndarray:
+    """
+    Same as `evaluate_states` on the children of `state` (the state after each action, in the view of the child), computed
+    incrementally: the line codes and the move scores are computed once for `state`, and each child only updates the 32 codes
+    changed by its stone and rescores these 32 points.
+    """
+    n = state.shape[0]
+    n_children = len(actions)
+    table = pattern_table()
+    indices, powers = update_indices(n)
+    indices, powers = indices[actions], powers[actions]
+    rows = np.arange(n_children)[:, None]
+    directions = np.arange(32) // 8
+    points = np.where(indices < 4 * n * n, indices % (n * n), n * n)  # The changed points, n * n for the dummy entries
+    empty = np.append((state == 0).reshape(-1), False)
+
+    def children_scores(codes: np.ndarray, stone: int) -> np.ndarray:
+        """
+        The move scores [n_children, n * n] of a player with the line `codes` in `state`, after the player to move (-1)
+        placed its stone, which is `stone` (OWN or BLOCKED) in the codes of that player.
+        """
+        scores = np.tile(np.append(scores_from_patterns(table[codes]).reshape(-1) * empty[:-1], 0), (n_children, 1))
+        point_codes = np.append(codes.reshape(4, -1), np.zeros((4, 1), dtype=codes.dtype), axis=1)[:, points]
+        point_codes = point_codes.transpose(1, 2, 0).copy()  # [n_children, 32, 4]
+        point_codes[rows, np.arange(32), directions] += stone * powers
+        scores[rows, points] = scores_from_patterns(table[point_codes][..., None, None])[..., 0, 0] * empty[points]
+        scores[np.arange(n_children), actions] = 0
+        return scores[:, :-1]
+
+    # The player to move in `state` (-1) places the stone, and becomes the player who moved last (1) in the children
+    last_codes, next_codes = line_codes(state[None], -1)[0], line_codes(state[None], 1)[0]
+    x, y = np.divmod(actions, n)
+    last_has_five = (table[last_codes[:, x, y]] == FIVE).any(axis=0) | has_five(state[None], -1)[0]
+    return _evaluate(children_scores(last_codes, OWN), children_scores(next_codes, BLOCKED), last_has_five, scale)
+
+
+def policy_from_scores(attack: np.ndarray, defense: np.ndarray, empty: np.ndarray, temperature: float = 1.0) -> np.ndarray:
+    logits = np.log1p(attack + 0.9 * defense) / temperature
+    logits = np.where(empty, logits, -np.inf)
+    probs = np.exp(logits - logits.max())
+    return probs / probs.sum()
+
+
+def get_pattern_player(board_size: int, temperature: float = 1.0) -> IntuitivePlayer:
+    """
+    Get a player with the pattern evaluator as policy generator and value estimator. It needs no NN, so it can be used as a
+    fast baseline opponent or as the prior of the early self-play games.
+    """
+    pattern_table()  # Build the table once, outside the search
+
+    def policy_generator(state: np.ndarray) -> np.ndarray:
+        """
+        Generate the policy for the given board (the player to move is -1).
+        """
+        states = state[None]
+        return policy_from_scores(move_scores(states, -1)[0], move_scores(states, 1)[0], state == 0, temperature).flatten()
+
+    def value_estimator(states: np.ndarray) -> np.ndarray:
+        if len(states) == 0:  # The children of a full board
+            return np.zeros(0, dtype=np.float32)
+        return evaluate_states(states)
+
+    def children_value_estimator(state: np.ndarray, actions: np.ndarray) -> np.ndarray:
+        return evaluate_children(state, actions)
+
+    return IntuitivePlayer(policy_generator, value_estimator, children_value_estimator)
+
+
+class PatternBoard:
+    """
+    Keep the line codes of all the points up to date while stones are placed and removed: placing a stone only changes the
+    codes of the 32 points within distance 4 on its 4 lines.
+    """
+    def __init__(self, board_size: int):
+        self.board_size = board_size
+        self.board = np.zeros((board_size, board_size), dtype=np.int8)
+        empty = self.board[None]
+        # codes[0]: for player 1, codes[1]: for player -1
+        self.codes = np.stack([line_codes(empty, 1)[0], line_codes(empty, -1)[0]])
+
+    def _update(self, x: int, y: int, player: int, sign: int):
+        for d, (dx, dy) in enumerate(DIRECTIONS):
+            for power, k in zip(POWERS, OFFSETS):
+                # (x, y) is at the offset k of the line of (qx, qy)
+                qx, qy = x - k * dx, y - k * dy
+                if 0 <= qx < self.board_size and 0 <= qy < self.board_size:
+                    self.codes[0, d, qx, qy] += sign * power * (OWN if player == 1 else BLOCKED)
+                    self.codes[1, d, qx, qy] += sign * power * (OWN if player == -1 else BLOCKED)
+
+    def place(self, x: int, y: int, player: int):
+        self.board[x, y] = player
+        self._update(x, y, player, 1)
+
+    def remove(self, x: int, y: int):
+        self._update(x, y, self.board[x, y], -1)
+        self.board[x, y] = 0
+
+    def sync(self, board: np.ndarray):
+        """
+        Place and remove stones until the board equals `board`.
+        """
+        for x, y in np.argwhere(self.board != board):
+            if self.board[x, y] != 0:
+                self.remove(x, y)
+            if board[x, y] != 0:
+                self.place(x, y, board[x, y])
+
+    def move_scores(self, player: int) -> np.ndarray:
+        patterns = pattern_table()[self.codes[0 if player == 1 else 1]]
+        return scores_from_patterns(patterns) * (self.board == 0)
+
+    def best_move(self, player: int) -> Tuple[int, int]:
+        scores = self.move_scores(player) + 0.9 * self.move_scores(-player)
+        scores = np.where(self.board == 0, scores, -1)
+        x, y = np.unravel_index(np.argmax(scores), scores.shape)
+        return int(x), int(y)
+
+
+def get_pattern_ai_play(board_size: int):
+    """
+    Get an `ai_play` function for `GomokuUI`, which plays the best move of the pattern evaluator.
+    """
+    pattern_board = PatternBoard(board_size)
+
+    def ai_play(board: np.ndarray) -> Tuple[int, int]:
+        pattern_board.sync(board)
+        player = 1 if np.sum(board == 1) == np.sum(board == -1) else -1  # 黑棋（1）先手
+        return pattern_board.best_move(player)
+
+    return ai_play
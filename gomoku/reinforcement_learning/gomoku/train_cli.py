@@ -0,0 +1,130 @@
+"""
+Headless training entry point.
+
+    python -m gomoku.reinforcement_learning.gomoku.train_cli --config train.json --n-batches 10
+
+The config file is a JSON object whose keys are the long option names with underscores (e.g. {"board_size": 15,
+"simulations_per_step": 1000}). Options given on the command line override the config file.
+With --observer-port, the games are published for `visualize_train.py`, which can be started (and stopped) at any time.
+"""
+import argparse
+import json
+
+from gomoku.reinforcement_learning.base.gumbel_search import GumbelRootSearch
+from gomoku.reinforcement_learning.gomoku.gomoku_train import GomokuTrainer
+from gomoku.reinforcement_learning.gomoku.game_events import GameEventPublisher
+from gomoku.reinforcement_learning.gomoku.opening_book import OpeningBook
+from gomoku.reinforcement_learning.gomoku.pattern_evaluator import get_pattern_player
+
+
+DEFAULT_CONFIG = {
+    "board_size": 15,
+    "simulations_per_step": 1000,
+    "c_puct": 5.0,
+    "search": "puct",
+    "max_considered_actions": 16,
+    "lockstep_games": 1,
+    "device": "auto",
+    "n_games_per_batch": 32,
+    "n_batches": 100,
+    "save_path": None,
+    "metrics_path": None,
+    "metrics_interval": 60.0,
+    "archive_path": None,
+    "opening_book": None,
+    "book_temperature": 1.0,
+    "book_min_visits": 10,
+    "bootstrap_batches": 0,
+    "observer_port": None,
+    "observer_interval": 0.2,
+    "verbose": True,
+}
+
+
+def parse_config(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description="Train the Gomoku model by self-play without UI.")
+    parser.add_argument("--config", help="JSON config file")
+    parser.add_argument("--board-size", type=int)
+    parser.add_argument("--simulations-per-step", type=int)
+    parser.add_argument("--c-puct", type=float)
+    parser.add_argument("--search", choices=["puct", "gumbel"], help="Root search: PUCT, or Gumbel sequential halving for 16-64 simulations")
+    parser.add_argument("--max-considered-actions", type=int, help="Number of root actions sampled by the Gumbel search")
+    parser.add_argument("--lockstep-games", type=int, help="Play this many games at once with batched NN evaluations (PUCT only)")
+    parser.add_argument("--device", help="cpu, cuda, ... or auto")
+    parser.add_argument("--n-games-per-batch", type=int)
+    parser.add_argument("--n-batches", type=int)
+    parser.add_argument("--save-path", help="Where to save the model after every batch")
+    parser.add_argument("--metrics-path", help="Export metrics snapshots to this .json or .csv file")
+    parser.add_argument("--metrics-interval", type=float)
+    parser.add_argument("--archive-path", help="Append the self-play games to this archive directory")
+    parser.add_argument("--opening-book", help="Opening book (.npz) consulted before searching")
+    parser.add_argument("--book-temperature", type=float, help="Temperature for sampling the book moves (0: most played)")
+    parser.add_argument("--book-min-visits", type=int, help="Only use the book for positions seen at least this often")
+    parser.add_argument("--bootstrap-batches", type=int, help="Search with the pattern evaluator instead of the model in the first batches")
+    parser.add_argument("--observer-port", type=int, help="Publish the games on this local port for the UI observer")
+    parser.add_argument("--observer-interval", type=float, help="Minimum seconds between two published snapshots")
+    parser.add_argument("--quiet", dest="verbose", action="store_false", default=None)
+    args = parser.parse_args(argv)
+
+    config = dict(DEFAULT_CONFIG)
+    if args.config is not None:
+        with open(args.config) as f:
+            file_config = json.load(f)
+        unknown = set(file_config) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError(f"Unknown config keys: {', '.join(sorted(unknown))}")
+        config.update(file_config)
+    config.update({key: value for key, value in vars(args).items() if key != "config" and value is not None})
+    return config
+
+
+def main(argv=None):
+    config = parse_config(argv)
+
+    device = config["device"]
+    if device == "auto":
+        import torch
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    publisher = None
+    callbacks = {}
+    if config["observer_port"] is not None:
+        publisher = GameEventPublisher(port=config["observer_port"], interval=config["observer_interval"])
+        callbacks = {"callback_per_game": publisher.callback_per_game, "callback_per_step": publisher.callback_per_step}
+        print(f"Publishing games on {publisher.address[0]}:{publisher.address[1]}")
+
+    opening_book = None
+    if config["opening_book"] is not None:
+        opening_book = OpeningBook.load(config["opening_book"], min_visits=config["book_min_visits"], temperature=config["book_temperature"])
+
+    root_search = None
+    if config["search"] == "gumbel":
+        root_search = GumbelRootSearch(config["simulations_per_step"], config["c_puct"], config["max_considered_actions"])
+
+    trainer = GomokuTrainer(
+        config["board_size"], config["simulations_per_step"], config["c_puct"], device,
+        verbose=config["verbose"],
+        metrics_path=config["metrics_path"], metrics_interval=config["metrics_interval"],
+        archive_path=config["archive_path"], opening_book=opening_book, root_search=root_search,
+        lockstep_games=config["lockstep_games"],
+        **callbacks
+    )
+
+    if config["bootstrap_batches"] > 0:
+        trainer.set_search_player(get_pattern_player(config["board_size"]))
+
+    try:
+        for i in range(config["n_batches"]):
+            if i == config["bootstrap_batches"]:
+                trainer.set_search_player(None)
+            loss = trainer.self_play(config["n_games_per_batch"], 1)[0]
+            print(f"Batch {i + 1}/{config['n_batches']}: loss {loss:.4f}")
+            if config["save_path"] is not None:
+                trainer.save(config["save_path"])
+    finally:
+        if publisher is not None:
+            publisher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,70 @@
-import threading
+"""
+Watch the self-play games of a running training.
 
-from gomoku.game.board import GomoBoard
-from gomoku.reinforcement_learning.gomoku.gomoku_env import GomoEnv
-from gomoku.reinforcement_learning.gomoku.gomoku_train import GomokuTrainer
+    python -m gomoku.reinforcement_learning.gomoku.train_cli --observer-port 5070 ...
+    python -m gomoku.reinforcement_learning.gomoku.visualize_train --port 5070
+
+The observer runs in its own process and polls the latest published snapshot, so the training never waits for the UI.
+"""
+import argparse
 
-from PySide6.QtCore import QThread, Signal, QObject
+from PySide6.QtCore import QTimer
 from PySide6.QtWidgets import QApplication
-from gomoku.winui.main_window import GomokuUI
 
+from gomoku.game.board import GomoBoard
+from gomoku.winui.main_window import GomokuUI
+from gomoku.reinforcement_learning.gomoku.game_events import GameEventSubscriber
 
-class BoardUpdater(QObject):
-    update_signal = Signal()  # Signal to emit x, y coordinates
 
-    def __init__(self, board_ui: GomokuUI):
-        super().__init__()
+class TrainingObserver:
+    def __init__(self, board_ui: GomokuUI, subscriber: GameEventSubscriber, refresh_interval_ms: int = 100):
         self.board_ui = board_ui
-        self.update_signal.connect(self.board_ui.update_game_state)
-
-
-app = QApplication([])
-board_ui = GomokuUI(GomoBoard())
-board_ui.show()
-
-board_updater = BoardUpdater(board_ui)
-
-
-def callback_per_step(env: GomoEnv):
-    board_ui.board.play(*env.board.get_action())
-    board_updater.update_signal.emit()
-
-def callback_per_game(env: GomoEnv):
-    board_ui.board.reset()
-    board_updater.update_signal.emit()
-
-
-trainer = GomokuTrainer(15, 1000, 5, "cuda", 
-                       callback_per_game=callback_per_game,
-                       callback_per_step=callback_per_step)
-
-
-class TrainingThread(QThread):
-    def __init__(self, trainer, n_games_per_batch, n_batches):
-        super().__init__()
-        self.trainer = trainer
-        self.n_games_per_batch = n_games_per_batch
-        self.n_batches = n_batches
-
-    def run(self):
-        self.trainer.self_play(self.n_games_per_batch, self.n_batches)
-
-training_thread = TrainingThread(trainer, 32, 100)
-training_thread.start()
-
-print("Training started...")
-
-app.exec()
+        self.subscriber = subscriber
+        self.game_index = None
+
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(refresh_interval_ms)
+
+    def refresh(self):
+        snapshot = self.subscriber.latest()
+        if snapshot is None:
+            return
+
+        board = self.board_ui.board
+        if snapshot["board_size"] != board.board_size:
+            return
+        moves = snapshot["moves"]
+        n_shown = len(board.history) - 1
+        # Only play the new moves if the snapshot continues the shown game, otherwise redraw the game from the start
+        if snapshot["game"] != self.game_index or n_shown > len(moves):
+            self.game_index = snapshot["game"]
+            board.reset()
+            n_shown = 0
+        for action in moves[n_shown:]:
+            board.play(action // board.board_size, action % board.board_size)
+        self.board_ui.setWindowTitle(f"五子棋 - 第{self.game_index}局")
+        self.board_ui.update_game_state()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Watch the self-play games of a training started with --observer-port.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5070)
+    parser.add_argument("--board-size", type=int, default=15)
+    parser.add_argument("--refresh-interval-ms", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    app = QApplication([])
+    board_ui = GomokuUI(GomoBoard(args.board_size))
+    board_ui.show()
+
+    subscriber = GameEventSubscriber(args.host, args.port)
+    observer = TrainingObserver(board_ui, subscriber, args.refresh_interval_ms)
+
+    app.exec()
+    subscriber.close()
+
+
+if __name__ == "__main__":
+    main()
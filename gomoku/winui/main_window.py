@@ -1,15 +1,83 @@
 from typing import Callable, Union, Optional
+import inspect
+import threading
+import time
 import numpy as np
 
-from PySide6.QtWidgets import QApplication, QMainWindow, QGraphicsScene, QGraphicsView, QGraphicsEllipseItem, QMessageBox, QWidget, QHBoxLayout, QVBoxLayout, QPushButton, QSlider, QLabel
+from PySide6.QtWidgets import QApplication, QMainWindow, QGraphicsScene, QGraphicsView, QGraphicsEllipseItem, QMessageBox, QWidget, QHBoxLayout, QVBoxLayout, QPushButton, QSlider, QLabel, QCheckBox, QProgressBar, QListView, QFileDialog
 from PySide6.QtGui import QPen, QBrush, QColor
-from PySide6.QtCore import Qt, QRectF
+from PySide6.QtCore import Qt, QRectF, QThread, Signal, QAbstractListModel, QModelIndex
 
 from gomoku.game.board import GomoBoard
+from gomoku.game.archive import GameArchive
+
+
+class AIPlayWorker(QThread):
+    """
+    在后台线程中计算AI落子，避免搜索时界面卡住
+    """
+    progress_changed = Signal(float, object)  # 进度 (0~1)，根节点访问次数 [board_size, board_size]（可能为 None）
+    move_ready = Signal(int, int)
+
+    def __init__(self, ai_play_func: Callable, board: np.ndarray, with_progress: bool, progress_interval: float = 0.1):
+        super().__init__()
+        self.ai_play_func = ai_play_func
+        self.board = board
+        self.with_progress = with_progress
+        self.progress_interval = progress_interval  # 最短的进度更新间隔（秒）
+        self.last_progress = 0.0
+        self.latest_visits = None
+        self.cancel_event = threading.Event()
+
+    def run(self):
+        if self.with_progress:
+            move = self.ai_play_func(self.board, self.report_progress)
+        else:
+            move = self.ai_play_func(self.board)
+        if move is not None and not self.cancel_event.is_set():
+            self.move_ready.emit(*move)
+
+    def report_progress(self, fraction: float, visits: Optional[np.ndarray] = None) -> bool:
+        """
+        Called by ai_play_func in the worker thread. Return False if the search should be cancelled.
+        """
+        if visits is not None:
+            self.latest_visits = visits
+        now = time.time()
+        if now - self.last_progress >= self.progress_interval or fraction >= 1:
+            self.last_progress = now
+            self.progress_changed.emit(fraction, self.latest_visits)
+        return not self.cancel_event.is_set()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+
+class GameArchiveListModel(QAbstractListModel):
+    """
+    棋谱库中对局的列表，只在显示某一行时读取该对局的索引
+    """
+    def __init__(self, archive: GameArchive):
+        super().__init__()
+        self.archive = archive
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.archive)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        winner = {1: "黑棋胜", -1: "白棋胜", 0: "平局"}[self.archive.winner(index.row())]
+        return f"第{index.row()}局  {self.archive.game_length(index.row())}手  {winner}"
 
 
 class GomokuUI(QMainWindow):
-    def __init__(self, board: GomoBoard, board_size_px: int = 600, ai_play: Callable[[np.ndarray], tuple[int, int]] = None):
+    def __init__(self, board: GomoBoard, board_size_px: int = 600, ai_play: Callable[..., tuple[int, int]] = None):
+        """
+        ai_play(board) -> (x, y) computes the AI move in a background thread.
+        If it accepts a second argument, it is called as ai_play(board, progress), where progress(fraction, visits=None)
+        reports the search progress and the root visit distribution, and returns False when the search is cancelled.
+        """
         super().__init__()
         self.board = board  # 创建五子棋环境
 
@@ -28,8 +96,18 @@ class GomokuUI(QMainWindow):
             app.setFont(font)
 
         self.hover_pawn = None
-        self.pawns = []
+        self.hover_point = None
+        self.stone_items = dict()  # (x, y) -> (棋子, 步数文字)，预先创建，只切换显示状态
+        self.shown_board = np.zeros((self.board.board_size, self.board.board_size), dtype=np.int8)  # 当前已显示的棋盘
+        self.shown_numbers = dict()  # 当前已显示的步数 (x, y) -> move_number
         self.ai_play_func = ai_play
+        self.ai_play_with_progress = ai_play is not None and len(inspect.signature(ai_play).parameters) >= 2
+        self.ai_worker = None
+        self.heatmap_items = dict()  # (x, y) -> 搜索热力图方块
+
+        # 棋谱库：回放时显示 archive 中的第 archive_game 局（为 None 时回放当前对局）
+        self.archive: Optional[GameArchive] = None
+        self.archive_game: Optional[int] = None
 
         # This controls the replay mode
         self.replay_mode = False
@@ -62,6 +140,7 @@ class GomokuUI(QMainWindow):
         self.board_view.setFixedSize(self.board_size_px * 1.04, self.board_size_px * 1.04)
         self.board_view.setMouseTracking(True)  # 开启鼠标跟踪
         self.draw_board()
+        self.create_stone_items()
         
         main_layout.addWidget(self.board_view)
 
@@ -70,7 +149,7 @@ class GomokuUI(QMainWindow):
         toolbar_layout = QVBoxLayout(toolbar_widget)
         toolbar_layout.setSpacing(10)  # Reduced spacing between elements
         toolbar_widget.setFixedWidth(self.board_size_px * 0.7)
-        toolbar_widget.setFixedHeight(self.board_size_px * 0.4)  # Match the board height
+        toolbar_widget.setFixedHeight(self.board_size_px * 1.04)  # Match the board height
 
 
         control_layout = QHBoxLayout()
@@ -89,6 +168,20 @@ class GomokuUI(QMainWindow):
 
         toolbar_layout.addLayout(control_layout)
 
+        # AI搜索进度与热力图
+        ai_layout = QHBoxLayout()
+        self.ai_progress_bar = QProgressBar()
+        self.ai_progress_bar.setRange(0, 100)
+        self.ai_progress_bar.setMaximumWidth(self.cell_size * 4)
+        self.ai_progress_bar.setVisible(False)
+        ai_layout.addWidget(self.ai_progress_bar)
+
+        self.heatmap_checkbox = QCheckBox("显示搜索热力图")
+        self.heatmap_checkbox.toggled.connect(self.handle_heatmap_toggled)
+        ai_layout.addWidget(self.heatmap_checkbox)
+
+        toolbar_layout.addLayout(ai_layout)
+
 
         #  新的一行
         mode_layout = QHBoxLayout()
@@ -137,13 +230,25 @@ class GomokuUI(QMainWindow):
         slider_layout.addWidget(self.replay_forward_button)
         self.replay_forward_button.clicked.connect(self.replay_forward)
 
-        self.replay_step_label = QLabel(f"当前步数：{self.current_step} / {len(self.board.history) - 1}")
+        self.replay_step_label = QLabel(f"当前步数：{self.current_step} / {self.n_history_steps()}")
         self.replay_step_label.setMaximumWidth(self.cell_size * 4)
         self.replay_step_label.setMinimumHeight(self.cell_size * 0.6)
         slider_layout.addWidget(self.replay_step_label)
 
         toolbar_layout.addLayout(slider_layout)
 
+        # 棋谱库
+        self.open_archive_button = QPushButton("打开棋谱库")
+        self.open_archive_button.setMaximumWidth(self.cell_size * 4)
+        self.open_archive_button.setMinimumHeight(self.cell_size * 0.6)
+        self.open_archive_button.clicked.connect(self.open_archive)
+        toolbar_layout.addWidget(self.open_archive_button)
+
+        self.archive_list = QListView()
+        self.archive_list.setUniformItemSizes(True)  # 不需要逐行计算大小，几千局也能快速显示
+        self.archive_list.setVisible(False)
+        toolbar_layout.addWidget(self.archive_list)
+
         # Add stretch to push elements to the top
         toolbar_layout.addStretch()
 
@@ -179,21 +284,25 @@ class GomokuUI(QMainWindow):
             return
         if x < 0 or x >= self.board.board_size or y < 0 or y >= self.board.board_size:
             return
+        self.cancel_ai_play()
         self.put_piece(x, y)
 
     def handle_move(self, x: int, y: int):
-        if self.hover_pawn is not None:
-            self.scene.removeItem(self.hover_pawn)
-            self.hover_pawn = None  # 移除之前的棋子
         if x < 0 or x >= self.board.board_size or y < 0 or y >= self.board.board_size:
+            self.hover_pawn.setVisible(False)
+            self.hover_point = None
             return
 
         if self.board.get_player() == -1:  # 注意到current_player表示的是上一步的，不是这一步的
             color = QColor(0, 0, 0, 100)
         else:
             color = QColor(255, 255, 255, 100)
-        
-        self.hover_pawn = self.draw_piece(x, y, color)  # 显示鼠标悬停的棋子
+        self.hover_pawn.setBrush(QBrush(color))
+
+        if self.hover_point != (x, y):  # 只移动悬停棋子，不重新创建
+            self.hover_point = (x, y)
+            self.hover_pawn.setRect(self.piece_rect(x, y))
+        self.hover_pawn.setVisible(True)
 
     def put_piece(self, x: int, y: int):
         if self.board.winner is not None:
@@ -208,16 +317,72 @@ class GomokuUI(QMainWindow):
 
 
     def undo(self):
+        self.cancel_ai_play()
         self.board.undo()
         self.update_game_state()
     
     def ai_play(self):
-        if self.ai_play_func is None:
+        if self.ai_play_func is None or self.ai_worker is not None:
+            return
+        self.ai_worker = AIPlayWorker(self.ai_play_func, self.board.get_board().copy(), self.ai_play_with_progress)
+        self.ai_worker.progress_changed.connect(self.handle_ai_progress)
+        self.ai_worker.move_ready.connect(self.handle_ai_move)
+        self.ai_worker.finished.connect(self.handle_ai_finished)
+        self.ai_play_button.setEnabled(False)
+        self.ai_progress_bar.setValue(0)
+        self.ai_progress_bar.setVisible(self.ai_play_with_progress)
+        self.ai_worker.start()
+
+    def cancel_ai_play(self):
+        if self.ai_worker is not None:
+            self.ai_worker.cancel()
+
+    def handle_ai_progress(self, fraction: float, visits: Optional[np.ndarray]):
+        if self.sender() is not self.ai_worker or self.ai_worker.cancel_event.is_set():
+            return
+        self.ai_progress_bar.setValue(int(fraction * 100))
+        if visits is not None and self.heatmap_checkbox.isChecked():
+            self.update_heatmap(visits)
+
+    def handle_ai_move(self, x: int, y: int):
+        if self.sender() is not self.ai_worker or self.ai_worker.cancel_event.is_set():
             return
-        x, y = self.ai_play_func(self.board.get_board())
         self.put_piece(x, y)
 
+    def handle_ai_finished(self):
+        if self.sender() is not self.ai_worker:
+            return
+        self.ai_worker = None
+        self.ai_play_button.setEnabled(True)
+        self.ai_progress_bar.setVisible(False)
+        self.clear_heatmap()
+
+    def update_heatmap(self, visits: np.ndarray):
+        """根据根节点各子节点的访问次数显示热力图"""
+        max_visits = visits.max()
+        for (i, j), item in self.heatmap_items.items():
+            if visits[i, j] == 0:
+                item.setVisible(False)
+            else:
+                item.setBrush(QBrush(QColor(255, 0, 0, int(30 + 170 * visits[i, j] / max_visits))))
+                item.setVisible(True)
+
+    def handle_heatmap_toggled(self, checked: bool):
+        if not checked:
+            self.clear_heatmap()
+
+    def clear_heatmap(self):
+        for item in self.heatmap_items.values():
+            item.setVisible(False)
+
+    def closeEvent(self, event):
+        if self.ai_worker is not None:
+            self.ai_worker.cancel()
+            self.ai_worker.wait()
+        super().closeEvent(event)
+
     def switch_mode(self):
+        self.cancel_ai_play()
         # 切换到回放模式
         if not self.replay_mode:
             self.replay_mode = True
@@ -225,11 +390,12 @@ class GomokuUI(QMainWindow):
             self.mode_label.setText("当前模式：回放模式")
             self.undo_button.setEnabled(False)
             self.replay_slider.setEnabled(True)
-            self.replay_slider.setMaximum(len(self.board.history) - 1)
-            self.replay_slider.setValue(len(self.board.history) - 1)
+            self.replay_slider.setMaximum(self.n_history_steps())
+            self.replay_slider.setValue(self.n_history_steps())
             self.replay_back_button.setEnabled(True)
             self.replay_forward_button.setEnabled(True)
-            self.current_step = len(self.board.history) - 1
+            self.current_step = self.n_history_steps()
+            self.update_game_state()
 
         # 切换到对战模式（从当前回放处开始）
         else:
@@ -240,21 +406,30 @@ class GomokuUI(QMainWindow):
             self.replay_slider.setEnabled(False)
             self.replay_back_button.setEnabled(False)
             self.replay_forward_button.setEnabled(False)
-            self.board.jump_to(self.current_step)
+            if self.archive_game is None:
+                self.board.jump_to(self.current_step)
+            else:
+                # 从棋谱库的对局的当前步开始对战
+                self.board.reset()
+                for k in range(1, self.current_step + 1):
+                    self.board.play(*self.archive.action(self.archive_game, k))
+                self.archive_game = None
+                self.archive_list.clearSelection()
             
             self.current_step = -1
+            self.update_game_state()
 
     def replay_back(self):
         if self.current_step == -1:
-            self.current_step = len(self.board.history) - 1
+            self.current_step = self.n_history_steps()
         if self.current_step > 0:
             self.current_step -= 1
         self.replay_slider.setValue(self.current_step)
 
     def replay_forward(self):
         if self.current_step == -1:
-            self.current_step = len(self.board.history) - 1
-        if self.current_step < len(self.board.history) - 1:
+            self.current_step = self.n_history_steps()
+        if self.current_step < self.n_history_steps():
             self.current_step += 1
         self.replay_slider.setValue(self.current_step)
     
@@ -263,64 +438,121 @@ class GomokuUI(QMainWindow):
 
         self.update_game_state()
 
+    def open_archive(self):
+        path = QFileDialog.getExistingDirectory(self, "打开棋谱库")
+        if not path:
+            return
+        archive = GameArchive(path)
+        if archive.board_size != self.board.board_size:
+            QMessageBox.warning(self, "无法打开", f"棋谱库的棋盘大小为 {archive.board_size}")
+            return
+        self.archive = archive
+        self.archive_game = None
+        self.archive_list.setModel(GameArchiveListModel(archive))
+        self.archive_list.selectionModel().currentChanged.connect(self.handle_archive_game_selected)
+        self.archive_list.setVisible(True)
+
+    def handle_archive_game_selected(self, index: QModelIndex):
+        if not index.isValid():
+            return
+        self.cancel_ai_play()
+        self.archive_game = index.row()
+        if not self.replay_mode:
+            self.switch_mode()
+        else:
+            self.replay_slider.setMaximum(self.n_history_steps())
+            self.replay_slider.setValue(self.n_history_steps())
+            self.current_step = self.n_history_steps()
+            self.update_game_state()
 
-    def update_game_state(self):
-        """根据 Env 的状态更新棋子和其他UI"""
-        for pawn in self.pawns:
-            self.scene.removeItem(pawn)
-        self.pawns.clear()
+    def n_history_steps(self) -> int:
+        """回放的对局的总步数"""
+        if self.archive_game is not None:
+            return self.archive.game_length(self.archive_game)
+        return len(self.board.history) - 1
 
-        self.replay_step_label.setText(f"当前步数：{self.current_step} / {len(self.board.history) - 1}")
-        board = self.board.get_board(self.current_step)
-        
-        # Get the last 5 moves
-        last_5_moves = []
-        if self.current_step == -1:
-            last_5_moves = self.board.history[1:][-5:]
-        else:
-            last_5_moves = self.board.history[1:][max(0, self.current_step-4):self.current_step+1]
-        
-        # Create a dictionary mapping coordinates to move numbers
-        move_numbers = dict()
-        for idx, (_, (x, y), _) in enumerate(last_5_moves):
-            move_numbers[(x, y)] = len(self.board.history) - len(last_5_moves) + idx
+    def board_at(self, step: int) -> np.ndarray:
+        """回放的对局第 step 步后的棋盘。棋谱库的对局按需从落子序列重建"""
+        if self.archive_game is not None:
+            return self.archive.position(self.archive_game, step)
+        return self.board.get_board(step)
+
+    def action_at(self, step: int) -> tuple[int, int]:
+        """回放的对局第 step 步的落子"""
+        if self.archive_game is not None:
+            return self.archive.action(self.archive_game, step)
+        return tuple(self.board.get_action(step))
 
+    def update_game_state(self):
+        """根据 Env 的状态更新棋子和其他UI，只更新发生变化的位置"""
+        self.replay_step_label.setText(f"当前步数：{self.current_step} / {self.n_history_steps()}")
+        step = self.n_history_steps() if self.current_step == -1 else self.current_step
+        board = self.board_at(step)
+
+        for i, j in np.argwhere(board != self.shown_board):
+            piece, _ = self.stone_items[(i, j)]
+            if board[i, j] == 0:
+                piece.setVisible(False)
+            else:
+                piece.setBrush(QBrush(Qt.black if board[i, j] == 1 else Qt.white))  # 1: 黑棋，-1: 白棋
+                piece.setVisible(True)
+        self.shown_board = board.copy()
+
+        # Show the move numbers of the last 5 moves
+        move_numbers = {self.action_at(k): k for k in range(max(1, step - 4), step + 1)}
+        for point in set(self.shown_numbers) | set(move_numbers):
+            if self.shown_numbers.get(point) == move_numbers.get(point):
+                continue
+            _, text = self.stone_items[point]
+            if point in move_numbers:
+                text.setPlainText(str(move_numbers[point]))
+                # Center the text on the piece
+                text.setPos(
+                    (point[0] + 0.5) * self.cell_size - text.boundingRect().width() / 2,
+                    (point[1] + 0.5) * self.cell_size - text.boundingRect().height() / 2
+                )
+                text.setVisible(True)
+            else:
+                text.setVisible(False)
+        self.shown_numbers = move_numbers
+
+    def create_stone_items(self):
+        """预先为每个位置创建棋子、步数文字和热力图方块（隐藏），以及悬停棋子"""
         for i in range(self.board.board_size):
             for j in range(self.board.board_size):
-                if board[i, j] == 1:  # 黑棋
-                    self.pawns.append(self.draw_piece(i, j, Qt.black, move_numbers.get((i, j))))
-                elif board[i, j] == -1:  # 白棋
-                    self.pawns.append(self.draw_piece(i, j, Qt.white, move_numbers.get((i, j))))
-
-    def draw_piece(self, x: float, y: float, color: tuple, move_number: Optional[int] = None):
-        """绘制棋子"""
-        ellipse = QRectF(
+                piece = self.scene.addEllipse(self.piece_rect(i, j), QPen(Qt.black), QBrush(Qt.black))
+                piece.setZValue(1)
+                piece.setVisible(False)
+
+                text = self.scene.addText("")
+                text.setDefaultTextColor(Qt.red)
+                font = text.font()
+                font.setPointSize(self.cell_size * 0.3)
+                text.setFont(font)
+                text.setZValue(2)
+                text.setVisible(False)
+
+                self.stone_items[(i, j)] = (piece, text)
+
+                heatmap_item = self.scene.addRect(
+                    i * self.cell_size, j * self.cell_size, self.cell_size, self.cell_size, QPen(Qt.NoPen), QBrush(Qt.red)
+                )
+                heatmap_item.setZValue(0.5)
+                heatmap_item.setVisible(False)
+                self.heatmap_items[(i, j)] = heatmap_item
+
+        self.hover_pawn = self.scene.addEllipse(self.piece_rect(0, 0), QPen(Qt.black), QBrush(Qt.black))
+        self.hover_pawn.setZValue(3)
+        self.hover_pawn.setVisible(False)
+
+    def piece_rect(self, x: float, y: float) -> QRectF:
+        """棋子所在的矩形"""
+        return QRectF(
             (x + 0.5) * self.cell_size - self.display_args["pawn_size"] / 2, 
             (y + 0.5) * self.cell_size - self.display_args["pawn_size"] / 2,
             self.display_args["pawn_size"], 
             self.display_args["pawn_size"],
         )
-        piece = self.scene.addEllipse(ellipse, QPen(Qt.black), QBrush(color))
-        
-        if move_number is not None:
-            text = self.scene.addText(str(move_number))
-            text.setDefaultTextColor(Qt.red)
-            font = text.font()
-            font.setPointSize(self.cell_size * 0.3)
-            text.setFont(font)
-            
-            # Center the text on the piece
-            text_width = text.boundingRect().width()
-            text_height = text.boundingRect().height()
-            text_x = (x + 0.5) * self.cell_size - text_width / 2
-            text_y = (y + 0.5) * self.cell_size - text_height / 2
-            text.setPos(text_x, text_y)
-            
-            # Group the piece and text together
-            group = self.scene.createItemGroup([piece, text])
-            return group
- 
-        return piece
 
 
 if __name__ == "__main__":